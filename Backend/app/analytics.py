@@ -0,0 +1,197 @@
+import os
+from datetime import date, datetime
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from . import models
+
+# population views for coaching staff. metric tables are streamed in column chunks
+# (yield_per) and reduced with numpy, so memory is bounded by the chunk size and the
+# output shape, not by the number of rows
+CHUNK_ROWS = int(os.getenv("HEALTHFLOW_ANALYTICS_CHUNK_ROWS", "50000"))
+
+# julian day number of 0001-01-01 minus one, to go back to date ordinals
+JDN_OFFSET = 1721425
+
+BMI_CATEGORIES = [
+    ("bajo_peso", 0.0, 18.5),
+    ("normal", 18.5, 25.0),
+    ("sobrepeso", 25.0, 30.0),
+    ("obesidad", 30.0, np.inf)
+]
+
+# fine histogram the percentiles are read from, 0.1 BMI per bin;
+# the response groups it into 2.5 wide bins
+BMI_EDGES = np.round(np.arange(10.0, 60.05, 0.1), 1)
+BMI_BINS_PER_GROUP = 25
+
+PERCENTILES = [10, 25, 50, 75, 90]
+
+def _years_ago(today: date, years: int) -> datetime:
+    try:
+        return datetime(today.year - years, today.month, today.day)
+    except ValueError:  # feb 29
+        return datetime(today.year - years, today.month, 28)
+
+def cohort_filters(gender: Optional[str] = None, min_age: Optional[int] = None, max_age: Optional[int] = None):
+    today = date.today()
+    filters = []
+    if gender:
+        filters.append(models.User.gender == gender)
+    if min_age is not None:
+        filters.append(models.User.birthday <= _years_ago(today, min_age))
+    if max_age is not None:
+        filters.append(models.User.birthday > _years_ago(today, max_age + 1))
+    return filters
+
+def _chunks(dbs: List[Session], stmt):
+    # one session per storage shard; every user lives in exactly one of them
+    for db in dbs:
+        result = db.execute(stmt.execution_options(yield_per=CHUNK_ROWS))
+        for partition in result.partitions():
+            yield np.array(partition, dtype=np.float64).reshape(len(partition), -1)
+
+def _day_number(day_column):
+    # julian day number of a 'YYYY-MM-DD' column, so days stay numeric end to end
+    return func.julianday(day_column) + 0.5
+
+def _to_date(day_number) -> date:
+    return date.fromordinal(int(day_number) - JDN_OFFSET)
+
+def _histogram_percentiles(counts: np.ndarray, edges: np.ndarray):
+    total = counts.sum()
+    if total == 0:
+        return {f"p{p}": None for p in PERCENTILES}
+    cumulative = np.cumsum(counts)
+    positions = np.searchsorted(cumulative, np.array(PERCENTILES) / 100 * total)
+    return {f"p{p}": round(float(edges[i]), 1) for p, i in zip(PERCENTILES, positions)}
+
+def bmi_distribution(dbs: List[Session], **cohort):
+    # latest weight and height per user (sqlite returns the row holding max(date))
+    weights = select(
+        models.Weight.user_id,
+        models.Weight.weight,
+        func.max(models.Weight.date)
+    ).group_by(models.Weight.user_id).subquery()
+    heights = select(
+        models.Height.user_id,
+        models.Height.height,
+        func.max(models.Height.date)
+    ).group_by(models.Height.user_id).subquery()
+
+    stmt = select(weights.c.weight, heights.c.height).select_from(models.User).join(
+        weights, weights.c.user_id == models.User.id
+    ).join(
+        heights, heights.c.user_id == models.User.id
+    ).where(*cohort_filters(**cohort))
+
+    counts = np.zeros(len(BMI_EDGES) - 1, dtype=np.int64)
+    categories = np.zeros(len(BMI_CATEGORIES), dtype=np.int64)
+    category_edges = np.array([low for _, low, _ in BMI_CATEGORIES[1:]])
+    total, bmi_sum = 0, 0.0
+
+    for chunk in _chunks(dbs, stmt):
+        weight, height = chunk[:, 0], chunk[:, 1] / 100
+        valid = (height > 0) & np.isfinite(weight) & np.isfinite(height)
+        bmi = weight[valid] / height[valid] ** 2
+        counts += np.histogram(bmi, bins=BMI_EDGES)[0]
+        categories += np.bincount(np.searchsorted(category_edges, bmi, side="right"), minlength=len(BMI_CATEGORIES))
+        total += bmi.size
+        bmi_sum += float(bmi.sum())
+
+    return {
+        "users": total,
+        "mean": round(bmi_sum / total, 2) if total else None,
+        **_histogram_percentiles(counts, BMI_EDGES),
+        "categories": {name: int(count) for (name, _, _), count in zip(BMI_CATEGORIES, categories)},
+        "histogram": [
+            {"from": float(low), "to": float(high), "users": int(count)}
+            for low, high, count in zip(
+                BMI_EDGES[:-1:BMI_BINS_PER_GROUP],
+                BMI_EDGES[BMI_BINS_PER_GROUP::BMI_BINS_PER_GROUP],
+                np.add.reduceat(counts, np.arange(0, len(counts), BMI_BINS_PER_GROUP))
+            )
+        ]
+    }
+
+def _cohort_user_ids(dbs: List[Session], **cohort) -> np.ndarray:
+    stmt = select(models.User.id).where(*cohort_filters(**cohort)).order_by(models.User.id)
+    chunks = [chunk[:, 0] for chunk in _chunks(dbs, stmt)]
+    return np.sort(np.concatenate(chunks).astype(np.int64)) if chunks else np.zeros(0, dtype=np.int64)
+
+def _daily_totals(metric: str, start: date, **cohort):
+    day = models.DailyTotal.day
+    return select(
+        models.DailyTotal.user_id,
+        _day_number(day),
+        models.DailyTotal.total
+    ).join(models.User, models.User.id == models.DailyTotal.user_id).where(
+        models.DailyTotal.metric == metric,
+        # the result arrays end today; rows dated later (e.g. a utc timestamp
+        # already on tomorrow) fall outside them
+        day >= start,
+        day <= date.today(),
+        *cohort_filters(**cohort)
+    )
+
+def weekly_step_percentiles(dbs: List[Session], start: date, **cohort):
+    user_ids = _cohort_user_ids(dbs, **cohort)
+    first_week = start.toordinal() + JDN_OFFSET
+    first_week -= first_week % 7  # jdn % 7 == 0 is a monday
+    weeks = (date.today().toordinal() + JDN_OFFSET - first_week) // 7 + 1
+
+    # per (user, week) sums; bounded by cohort size x weeks, whatever the row count
+    sums = np.zeros(len(user_ids) * weeks)
+    seen = np.zeros(len(user_ids) * weeks, dtype=bool)
+
+    for chunk in _chunks(dbs, _daily_totals("steps", start, **cohort)):
+        users = np.searchsorted(user_ids, chunk[:, 0].astype(np.int64))
+        week = ((np.floor(chunk[:, 1]) - first_week) // 7).astype(np.int64)
+        cells = users * weeks + week
+        sums += np.bincount(cells, weights=chunk[:, 2], minlength=sums.size)
+        seen[cells] = True
+
+    matrix = np.where(seen, sums, np.nan).reshape(len(user_ids), weeks)
+    active = seen.reshape(len(user_ids), weeks).sum(axis=0)
+    # only weeks somebody logged: an all-nan column would warn and is skipped anyway
+    logged = active > 0
+    percentiles = np.full((len(PERCENTILES), weeks), np.nan)
+    if logged.any():
+        percentiles[:, logged] = np.nanpercentile(matrix[:, logged], PERCENTILES, axis=0)
+
+    result = []
+    for w in range(weeks):
+        if not active[w]:
+            continue
+        row = {"week": _to_date(first_week + w * 7), "users": int(active[w])}
+        row.update({f"p{p}": round(float(percentiles[i, w]), 1) for i, p in enumerate(PERCENTILES)})
+        result.append(row)
+    return result
+
+def water_intake_trend(dbs: List[Session], start: date, **cohort):
+    first_day = start.toordinal() + JDN_OFFSET
+    days = date.today().toordinal() + JDN_OFFSET - first_day + 1
+
+    totals = np.zeros(days)
+    users = np.zeros(days)
+    for chunk in _chunks(dbs, _daily_totals("water", start, **cohort)):
+        day = (np.floor(chunk[:, 1]) - first_day).astype(np.int64)
+        totals += np.bincount(day, weights=chunk[:, 2], minlength=days)
+        users += np.bincount(day, minlength=days)
+
+    logged = users > 0
+    averages = np.divide(totals, users, out=np.zeros(days), where=logged)
+
+    # least squares slope of the daily average, in glasses per day
+    slope = None
+    if logged.sum() >= 2:
+        slope = round(float(np.polyfit(np.flatnonzero(logged), averages[logged], 1)[0]), 4)
+
+    return {
+        "trend_per_day": slope,
+        "data": [
+            {"date": _to_date(first_day + d), "average": round(float(averages[d]), 2), "users": int(users[d])}
+            for d in np.flatnonzero(logged)
+        ]
+    }
@@ -0,0 +1,222 @@
+import argparse
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import DateTime, Float, Integer, delete, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import models, metrics
+
+# cold tier: raw rows older than the horizon are moved, one user and month at a time,
+# into compressed columnar files (numpy .npz, one array per column) and deleted from
+# the live tables, which keeps the sqlite file and its (user_id, date) indexes sized by
+# recent data. daily_totals and daily_metrics are never archived, so cumulative history
+# and the derived series keep reading sqlite; raw point history and exports merge the
+# archive in when they reach past the horizon, and imports into an archived month move
+# it back to the live table first.
+ARCHIVE_DIR = os.getenv("HEALTHFLOW_ARCHIVE_DIR", "./archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("HEALTHFLOW_ARCHIVE_AFTER_DAYS", "365"))
+
+# bmi's as-of join reads every height, so heights always stay live
+ARCHIVE_IMPORT_TYPES = [import_type for import_type in metrics.IMPORT_MODELS if import_type != "height"]
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def cutoff(today: Optional[date] = None) -> date:
+    # whole months only: everything before the month holding today - horizon
+    return _month_start((today or date.today()) - timedelta(days=ARCHIVE_AFTER_DAYS))
+
+def reaches_archive(start_date: datetime) -> bool:
+    return start_date.date() < cutoff()
+
+def archive_path(user_id: int, import_type: str, month: date) -> str:
+    return os.path.join(ARCHIVE_DIR, str(user_id), import_type, f"{month:%Y-%m}.npz")
+
+def _fields(import_type: str) -> List[str]:
+    # column order of the import schema, date first
+    return list(metrics.IMPORT_MODELS[import_type][1].model_fields)
+
+def _dtype(column):
+    if isinstance(column.type, DateTime):
+        return "datetime64[us]"
+    if isinstance(column.type, Integer):
+        return np.int64
+    if isinstance(column.type, Float):
+        return np.float64
+    return np.str_
+
+def write_month(user_id: int, import_type: str, month: date, rows: List[Tuple]):
+    # written to a temporary name and renamed, so a reader never sees half a file
+    model, _ = metrics.IMPORT_MODELS[import_type]
+    fields = _fields(import_type)
+    columns = list(zip(*rows))
+    arrays = {
+        field: np.array(values, dtype=_dtype(model.__table__.c[field]))
+        for field, values in zip(fields, columns)
+    }
+    path = archive_path(user_id, import_type, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(path + ".tmp", path)
+
+def read_month(user_id: int, import_type: str, month: date) -> List[Tuple]:
+    # a month thawed by a concurrent import may be gone already; its rows are live again
+    try:
+        with np.load(archive_path(user_id, import_type, month), allow_pickle=False) as data:
+            return list(zip(*(data[field].tolist() for field in _fields(import_type))))
+    except FileNotFoundError:
+        return []
+
+def archived_months(db: Session, user_id: int, import_type: str, first_month: Optional[date] = None, last_month: Optional[date] = None):
+    stmt = select(models.ArchivedMonth.month).where(
+        models.ArchivedMonth.user_id == user_id,
+        models.ArchivedMonth.import_type == import_type
+    ).order_by(models.ArchivedMonth.month)
+    if first_month:
+        stmt = stmt.where(models.ArchivedMonth.month >= first_month)
+    if last_month:
+        stmt = stmt.where(models.ArchivedMonth.month <= last_month)
+    return db.execute(stmt).scalars().all()
+
+def iter_rows(
+    db: Session,
+    user_id: int,
+    import_type: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> Iterator[Tuple]:
+    # archived rows in [start_date, end_date) in date order, one month in memory at a time
+    months = archived_months(
+        db, user_id, import_type,
+        _month_start(start_date.date()) if start_date else None,
+        _month_start(end_date.date()) if end_date else None
+    )
+    for month in months:
+        for row in read_month(user_id, import_type, month):
+            if (start_date is None or row[0] >= start_date) and (end_date is None or row[0] < end_date):
+                yield row
+
+def has_archives(db: Session) -> bool:
+    return db.execute(select(models.ArchivedMonth.user_id).limit(1)).first() is not None
+
+def _month_range(model, month: date):
+    return (
+        model.date >= datetime.combine(month, time.min),
+        model.date < datetime.combine(_next_month(month), time.min)
+    )
+
+def archive_user(db: Session, user_id: int, before: date) -> int:
+    # move every whole month before `before` out of the live tables. point metrics keep
+    # their latest row live, so the current stats snapshot never reads an archive
+    moved = 0
+    for import_type in ARCHIVE_IMPORT_TYPES:
+        model, _ = metrics.IMPORT_MODELS[import_type]
+        filters = [model.user_id == user_id, model.date < datetime.combine(before, time.min)]
+        if not all(metrics.is_cumulative(name) for name in metrics.IMPORT_METRICS[import_type]):
+            latest = db.execute(select(func.max(model.date)).where(model.user_id == user_id)).scalar()
+            if latest is not None:
+                filters.append(model.date < latest)
+
+        month_column = func.strftime("%Y-%m-01", model.date)
+        months = db.execute(select(month_column).where(*filters).distinct().order_by(month_column)).scalars().all()
+        columns = [getattr(model, field) for field in _fields(import_type)]
+        for month in map(date.fromisoformat, months):
+            month_filters = [*filters, *_month_range(model, month)]
+            rows = [tuple(row) for row in db.execute(select(*columns).where(*month_filters).order_by(model.date))]
+            # a month archived before (e.g. around a kept latest row) gets the new rows added
+            if month in archived_months(db, user_id, import_type, month, month):
+                rows = sorted(read_month(user_id, import_type, month) + rows)
+
+            # file first, then the manifest row and the delete in one transaction: a crash
+            # in between leaves a stray file that the next run overwrites
+            write_month(user_id, import_type, month, rows)
+            stmt = sqlite_insert(models.ArchivedMonth).values(
+                user_id=user_id, import_type=import_type, month=month, rows=len(rows)
+            )
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["user_id", "import_type", "month"],
+                set_={"rows": stmt.excluded.rows}
+            ))
+            moved += db.execute(delete(model).where(*month_filters)).rowcount
+            db.commit()
+    return moved
+
+def _restore_month(db: Session, user_id: int, import_type: str, month: date):
+    model, _ = metrics.IMPORT_MODELS[import_type]
+    fields = _fields(import_type)
+    rows = [dict(zip(fields, row), user_id=user_id) for row in read_month(user_id, import_type, month)]
+    if rows:
+        # the live table wins for a timestamp present in both
+        db.connection().execute(sqlite_insert(model).prefix_with("OR IGNORE"), rows)
+    db.execute(delete(models.ArchivedMonth).where(
+        models.ArchivedMonth.user_id == user_id,
+        models.ArchivedMonth.import_type == import_type,
+        models.ArchivedMonth.month == month
+    ))
+
+def thaw(db: Session, user_id: int, import_type: str, first_day: date, last_day: date):
+    # bring the archived months overlapping [first_day, last_day] back into the live
+    # table, inside the caller's transaction, so an import recomputes its rollups and
+    # derived series from complete data. files are removed once the caller commits;
+    # a leftover file is never read without its manifest row
+    months = archived_months(db, user_id, import_type, _month_start(first_day), _month_start(last_day))
+    for month in months:
+        _restore_month(db, user_id, import_type, month)
+    return months
+
+def remove_files(user_id: int, import_type: str, months: List[date]):
+    for month in months:
+        try:
+            os.remove(archive_path(user_id, import_type, month))
+        except FileNotFoundError:
+            pass
+
+def restore_user(db: Session, user_id: int, since: Optional[date] = None) -> int:
+    # months from `since` on (every month without it) back to the live tables,
+    # e.g. after raising HEALTHFLOW_ARCHIVE_AFTER_DAYS
+    restored = 0
+    for import_type in ARCHIVE_IMPORT_TYPES:
+        for month in archived_months(db, user_id, import_type, since):
+            _restore_month(db, user_id, import_type, month)
+            db.commit()
+            remove_files(user_id, import_type, [month])
+            restored += 1
+    return restored
+
+if __name__ == "__main__":
+    # python -m app.archive run [--before YYYY-MM-DD] | restore [--all]
+    parser = argparse.ArgumentParser(description="Archivo de mediciones antiguas")
+    parser.add_argument("command", choices=["run", "restore"])
+    parser.add_argument("--before", type=date.fromisoformat, help="archivar los meses anteriores a esta fecha (run)")
+    parser.add_argument("--all", action="store_true", help="restaurar todos los meses archivados (restore)")
+    args = parser.parse_args()
+
+    from .database import engine
+    from .migrations import upgrade
+    from .storage import backend
+    upgrade(engine)
+    for shard_engine in backend.engines():
+        upgrade(shard_engine)
+
+    before = _month_start(args.before) if args.before else cutoff()
+    total = 0
+    for session_factory in backend.sessionmakers():
+        db = session_factory()
+        try:
+            for user_id in db.execute(select(models.User.id)).scalars().all():
+                if args.command == "run":
+                    total += archive_user(db, user_id, before)
+                else:
+                    total += restore_user(db, user_id, None if args.all else cutoff())
+        finally:
+            db.close()
+    if args.command == "run":
+        print(f"{total} filas archivadas (antes de {before})")
+    else:
+        print(f"{total} meses restaurados")
@@ -0,0 +1,178 @@
+from datetime import date, datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud, crud_async, schemas, cache, columnar, passwords, tokens, etags
+from .database import get_async_db
+
+# async twins of the user and dashboard endpoints in main.py, swapped in when
+# HEALTHFLOW_DB_ASYNC is set so both stacks can be compared under load
+router = APIRouter()
+
+@router.post("/register", response_model=schemas.User)
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await crud_async.get_user_by_email(db, user.email):
+        raise HTTPException(status_code=400, detail="Email ya registrado")
+    if await crud_async.get_user_by_username(db, user.username):
+        raise HTTPException(status_code=400, detail="Ya existe un usuario con ese nombre")
+    password_hash = await passwords.hasher.hash_async(user.password)
+    return await crud_async.create_user(db, user, password_hash)
+
+@router.post("/login")
+async def login(user_credentials: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await crud_async.get_user_by_username(db, user_credentials.username)
+    valid, needs_rehash = await passwords.hasher.verify_async(
+        user_credentials.password, user.password if user else None
+    )
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenciales inválidas"
+        )
+    if needs_rehash:
+        password_hash = await passwords.hasher.hash_async(user_credentials.password)
+        await crud_async.update_password(db, user, password_hash)
+    return {
+        "user_id": user.id,
+        "access_token": tokens.issue(user.id),
+        "token_type": "bearer",
+        "expires_in": tokens.TOKEN_TTL_SECONDS
+    }
+
+@router.get("/users/{user_id}", response_model=schemas.User, dependencies=[Depends(tokens.require_user)])
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_user = await crud_async.get_user(db, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return db_user
+
+@router.get(
+    "/dashboard/{user_id}/current",
+    response_model=schemas.CurrentStats,
+    dependencies=[Depends(tokens.require_user)]
+)
+async def get_current_stats(
+    user_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    generation = cache.response_cache.generation(user_id)
+    version = await crud_async.get_data_version(db, user_id)
+    _, not_modified = etags.evaluate(
+        request, response, user_id, version, "current", date.today()
+    )
+    if not_modified:
+        return not_modified
+
+    cache_key = (user_id, "current", version, date.today())
+    stats = cache.response_cache.get(cache_key)
+    if stats is not None:
+        return stats
+
+    stats = await crud_async.get_current_stats(db, user_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    cache.response_cache.set(cache_key, stats, generation)
+    return stats
+
+@router.get("/dashboard/{user_id}/history/batch", dependencies=[Depends(tokens.require_user)])
+async def get_history_batch(
+    user_id: int,
+    period: str,
+    request: Request,
+    response: Response,
+    metrics: List[str] = Query(...),
+    resolution: str = "raw",
+    max_points: Optional[int] = Query(None, ge=3),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # every chart of the dashboard in one call: cached series are reused, the rest
+    # come from a single UNION ALL
+    metrics = list(dict.fromkeys(metrics))
+    generation = cache.response_cache.generation(user_id)
+    version = await crud_async.get_data_version(db, user_id)
+    _, not_modified = etags.evaluate(
+        request, response, user_id, version,
+        "batch", tuple(metrics), period, resolution, max_points, date.today()
+    )
+    if not_modified:
+        return not_modified
+
+    result = {}
+    for metric in metrics:
+        cached = cache.response_cache.get((user_id, "history", version, metric, period, resolution, max_points))
+        if cached is not None:
+            result[metric] = cached
+
+    missing = [metric for metric in metrics if metric not in result]
+    if missing:
+        if period not in crud.HISTORY_PERIODS:
+            raise HTTPException(status_code=400, detail="Período inválido")
+
+        start_date = datetime.now() - crud.HISTORY_PERIODS[period]
+
+        try:
+            fetched = await crud_async.get_metric_history_batch(db, user_id, missing, start_date, resolution, max_points)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for metric, series in fetched.items():
+            cache.response_cache.set((user_id, "history", version, metric, period, resolution, max_points), series, generation)
+            result[metric] = series
+
+    return {metric: result[metric] for metric in metrics}
+
+@router.get("/dashboard/{user_id}/history", dependencies=[Depends(tokens.require_user)])
+async def get_history(
+    user_id: int,
+    metric: str,
+    period: str,
+    request: Request,
+    response: Response,
+    resolution: str = "raw",
+    max_points: Optional[int] = Query(None, ge=3),
+    db: AsyncSession = Depends(get_async_db)
+):
+    columnar_type = columnar.negotiate(request.headers.get("accept"))
+    generation = cache.response_cache.generation(user_id)
+    version = await crud_async.get_data_version(db, user_id)
+    etag, not_modified = etags.evaluate(
+        request, response, user_id, version,
+        "history", columnar_type, metric, period, resolution, max_points, date.today(),
+        vary="Accept"
+    )
+    if not_modified:
+        return not_modified
+
+    cache_key = (user_id, "columns" if columnar_type else "history", version, metric, period, resolution, max_points)
+    cached = cache.response_cache.get(cache_key)
+    if cached is not None:
+        if columnar_type:
+            return etags.set_headers(columnar.response(cached, columnar_type), etag, "Accept")
+        return cached
+
+    if period not in crud.HISTORY_PERIODS:
+        raise HTTPException(status_code=400, detail="Período inválido")
+
+    start_date = datetime.now() - crud.HISTORY_PERIODS[period]
+
+    try:
+        if columnar_type:
+            result = await crud_async.get_metric_history_columns(db, user_id, metric, start_date, resolution, max_points)
+        else:
+            result = await crud_async.get_metric_history(db, user_id, metric, start_date, resolution, max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache.response_cache.set(cache_key, result, generation)
+    if columnar_type:
+        return etags.set_headers(columnar.response(result, columnar_type), etag, "Accept")
+    return result
+
+def install(app):
+    # drop the sync routes these replace, then mount the async ones
+    replaced = {(route.path, method) for route in router.routes for method in route.methods}
+    app.router.routes = [
+        route for route in app.router.routes
+        if not any((getattr(route, "path", None), method) in replaced for method in getattr(route, "methods", ()))
+    ]
+    app.include_router(router)
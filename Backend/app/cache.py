@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Hashable, Optional
+
+# in-process cache for dashboard responses. keys are tuples starting with the user id,
+# so every write for a user can drop exactly that user's entries
+CACHE_MAX_ENTRIES = int(os.getenv("HEALTHFLOW_CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("HEALTHFLOW_CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_BYTES = int(os.getenv("HEALTHFLOW_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+class ResponseCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, max_bytes: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires_at, size, value), oldest first
+        self.user_keys = defaultdict(set)
+        # bumped by invalidate_user; a set() computed before the bump is dropped
+        self.generations = defaultdict(int)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, user_id: int) -> int:
+        # taken before computing a value, passed back to set()
+        with self.lock:
+            return self.generations[user_id]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        # rough size of the payload as it goes over the wire
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generations[key[0]]:
+                # the user's data changed while the value was computed
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self.user_keys[key[0]].add(key)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        with self.lock:
+            self.generations[user_id] += 1
+            keys = self.user_keys.pop(user_id, ())
+            for key in keys:
+                _, size, _ = self.entries.pop(key)
+                self.size -= size
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+        user_keys = self.user_keys.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self.user_keys[key[0]]
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_MAX_BYTES)
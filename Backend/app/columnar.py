@@ -0,0 +1,59 @@
+import base64
+import json
+import sys
+from array import array
+from typing import Optional, Dict, Any
+from fastapi import Response
+from . import downsample
+
+# opt-in columnar encodings for history series, picked through the Accept header:
+#   columnar: {"dates": [...], "values": [...], ...} parallel arrays
+#   packed:   integer second offsets from "epoch" plus base64 little-endian float64 arrays
+COLUMNAR_JSON = "application/vnd.healthflow.columnar+json"
+PACKED_JSON = "application/vnd.healthflow.packed+json"
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is the fallback
+    orjson = None
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    if not accept:
+        return None
+    for media_type in (PACKED_JSON, COLUMNAR_JSON):
+        if media_type in accept:
+            return media_type
+    return None
+
+def _pack_floats(values) -> str:
+    packed = array("d", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+def pack(columns: Dict[str, Any]) -> Dict[str, Any]:
+    stamps = [int(downsample.timestamp(value)) for value in columns["dates"]]
+    epoch = stamps[0] if stamps else 0
+    packed = {
+        "epoch": epoch,
+        "offsets": [stamp - epoch for stamp in stamps],
+        "values": _pack_floats(columns["values"])
+    }
+    for key in ("min", "max"):
+        if key in columns:
+            packed[key] = _pack_floats(columns[key])
+    if "total" in columns:
+        packed["total"] = columns["total"]
+    return packed
+
+def _default(value):
+    return value.isoformat()
+
+def encode(content: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode("utf-8")
+
+def response(columns: Dict[str, Any], media_type: str) -> Response:
+    content = pack(columns) if media_type == PACKED_JSON else columns
+    return Response(content=encode(content), media_type=media_type)
@@ -1,8 +1,16 @@
+import json
+import os
+from collections import namedtuple
+from contextlib import nullcontext
+from functools import lru_cache
+from time import perf_counter
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime
-from typing import List, Dict, Any
-from . import models, schemas
+from sqlalchemy import bindparam, delete, func, select, update, literal, literal_column, null, type_coerce, union_all, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from pydantic import ValidationError
+from datetime import datetime, time, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Callable, Optional, Tuple
+from . import models, schemas, metrics, rollups, derived, archive, cache, live, downsample, instrumentation, passwords
 
 # user operations
 def get_user(db: Session, user_id: int):
@@ -14,11 +22,33 @@ def get_user_by_email(db: Session, email: str):
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
+# hot path statements are built once, with bound parameters, and executed with a
+# params dict: no per-request construction, and sqlalchemy's compiled cache always hits
+DATA_VERSION = select(models.User.data_version).where(models.User.id == bindparam("user_id"))
+
+BUMP_DATA_VERSION = update(models.User).where(models.User.id == bindparam("user_id")).values(
+    data_version=models.User.data_version + 1
+)
+
+def get_data_version(db: Session, user_id: int) -> Optional[int]:
+    # None when the user doesn't exist
+    return db.execute(DATA_VERSION, {"user_id": user_id}).scalar()
+
+def bump_data_version(db: Session, user_id: int):
+    # part of the caller's transaction, committed together with the write
+    db.execute(BUMP_DATA_VERSION, {"user_id": user_id})
+
+def create_user(
+    db: Session,
+    user: schemas.UserCreate,
+    data_session: Optional[Callable] = None,
+    password_hash: Optional[str] = None
+):
+    # endpoints hash on the password pool beforehand and pass password_hash in
     db_user = models.User(
         email=user.email,
         username=user.username,
-        password=user.password,
+        password=password_hash or passwords.hasher.hash(user.password),
         birthday=user.birthday,
         gender=user.gender
     )
@@ -26,253 +56,523 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.commit()
     db.refresh(db_user)
 
-    # add initial weight and height
-    weight = models.Weight(
-        date=datetime.now(),
-        user_id=db_user.id,
-        weight=user.current_weight
-    )
-    height = models.Height(
-        date=datetime.now(),
-        user_id=db_user.id,
-        height=user.current_height
-    )
-    db.add(weight)
-    db.add(height)
-    db.commit()
+    # add initial weight and height; data_session(db, user) hands out the session
+    # holding the user's measurements when storage is sharded
+    with (data_session(db, db_user) if data_session else nullcontext(db)) as data_db:
+        weight = models.Weight(
+            date=datetime.now(),
+            user_id=db_user.id,
+            weight=user.current_weight
+        )
+        height = models.Height(
+            date=datetime.now(),
+            user_id=db_user.id,
+            height=user.current_height
+        )
+        data_db.add(weight)
+        data_db.add(height)
+        data_db.flush()
+        today = weight.date.date()
+        derived.refresh_for_import(data_db, db_user.id, "weight", today, today)
+        bump_data_version(data_db, db_user.id)
+        data_db.commit()
+    cache.response_cache.invalidate_user(db_user.id)
 
     return db_user
 
 def verify_password(password: str, stored_password: str):
-    return password == stored_password  # simple string comparison
+    valid, _ = passwords.hasher.verify(password, stored_password)
+    return valid
+
+def update_password(db: Session, db_user: models.User, password_hash: str):
+    db_user.password = password_hash
+    db.commit()
 
 # data import operations
-def import_user_data(db: Session, user_id: int, import_type: str, data: List[Dict[str, Any]]):
-    model_map = {
-        "weight": models.Weight,
-        "height": models.Height,
-        "body_composition": models.BodyComposition,
-        "water": models.WaterConsumption,
-        "steps": models.DailySteps,
-        "exercise": models.Exercise,
-        "body_fat": models.BodyFatPercentage
+IMPORT_MODELS = metrics.IMPORT_MODELS
+
+# rows per commit; each batch is one executemany of the prepared upsert
+IMPORT_BATCH_SIZE = 500
+
+def _import_statements(model, schema):
+    # the stored values of a batch's dates and the INSERT ... ON CONFLICT DO UPDATE
+    # of one import type
+    fields = [key for key in schema.model_fields if key != "date"]
+    existing = select(model.date, *(getattr(model, key) for key in fields)).where(
+        model.user_id == bindparam("user_id"),
+        model.date.in_(bindparam("dates", expanding=True))
+    )
+    stmt = sqlite_insert(model)
+    upsert = stmt.on_conflict_do_update(
+        index_elements=["date", "user_id"],
+        set_={key: stmt.excluded[key] for key in fields}
+    )
+    return existing, upsert, fields
+
+IMPORT_STATEMENTS = {
+    import_type: _import_statements(model, schema)
+    for import_type, (model, schema) in IMPORT_MODELS.items()
+}
+
+def _changed_rows(db: Session, import_type: str, rows: List[Dict[str, Any]]):
+    # one SELECT of the stored values; a row identical to what's stored is skipped,
+    # so a resent export costs a read and no write. returns the rows to upsert and
+    # how many of them update an existing row
+    existing_stmt, _, fields = IMPORT_STATEMENTS[import_type]
+    stored = {
+        row[0]: tuple(row[1:])
+        for row in db.execute(existing_stmt, {
+            "user_id": rows[0]["user_id"],
+            "dates": [row["date"] for row in rows]
+        })
     }
+    changed = [row for row in rows if stored.get(row["date"]) != tuple(row[key] for key in fields)]
+    return changed, sum(1 for row in changed if row["date"] in stored)
+
+def _upsert_batch(db: Session, import_type: str, rows: List[Dict[str, Any]]):
+    db.connection().execute(IMPORT_STATEMENTS[import_type][1], rows)
 
-    if import_type not in model_map:
+def import_user_data(
+    db: Session,
+    user_id: int,
+    import_type: str,
+    data: Iterable[Dict[str, Any]],
+    on_batch: Optional[Callable[[Dict[str, int]], None]] = None
+):
+    if import_type not in IMPORT_MODELS:
         raise ValueError("Invalid import type")
 
-    model = model_map[import_type]
-    
+    _, schema = IMPORT_MODELS[import_type]
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "rejected": 0}
+    start = perf_counter()
+
+    # archived months are thawed with the moving average's reach around the batch
+    window = timedelta(days=derived.MOVING_AVERAGE_DAYS - 1)
+
+    def flush(batch):
+        days = [row_date.date() for row_date in batch]
+        thawed = archive.thaw(db, user_id, import_type, min(days) - window, max(days) + window)
+        changed, updated = _changed_rows(db, import_type, list(batch.values()))
+        counts["unchanged"] += len(batch) - len(changed)
+        if not changed:
+            # nothing to write: the rollback puts thawed months back in the archive
+            db.rollback()
+            if on_batch:
+                on_batch(dict(counts))
+            return
+
+        _upsert_batch(db, import_type, changed)
+        # rollups and derived series only for the days that changed
+        days = [row["date"].date() for row in changed]
+        for metric in metrics.IMPORT_METRICS[import_type]:
+            if metrics.is_cumulative(metric):
+                rollups.refresh_daily_totals(db, user_id, metric, min(days), max(days))
+        # after the rollups, the derived cumulative series read from them
+        derived.refresh_for_import(db, user_id, import_type, min(days), max(days))
+        bump_data_version(db, user_id)
+        # commit per batch so a long import never holds the write lock for its whole run
+        db.commit()
+        archive.remove_files(user_id, import_type, thawed)
+        cache.response_cache.invalidate_user(user_id)
+        counts["inserted"] += len(changed) - updated
+        counts["updated"] += updated
+        if on_batch:
+            on_batch(dict(counts))
+
+    # keyed by date so a repeated timestamp inside a batch keeps the last value
+    batch = {}
     for entry in data:
-        entry['date'] = datetime.fromisoformat(entry['date'])
-        entry['user_id'] = user_id
-        
-        existing = db.query(model).filter(
-            model.date == entry['date'],
-            model.user_id == user_id
-        ).first()
-        
-        if existing:
-            for key, value in entry.items():
-                setattr(existing, key, value)
-        else:
-            db_entry = model(**entry)
-            db.add(db_entry)
-    
+        try:
+            row = schema.model_validate(entry).model_dump()
+        except ValidationError:
+            counts["rejected"] += 1
+            continue
+        if row["date"].tzinfo is not None:
+            # stored dates are naive utc; an offset would never match the stored row
+            row["date"] = row["date"].astimezone(timezone.utc).replace(tzinfo=None)
+        row["user_id"] = user_id
+        batch[row["date"]] = row
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush(batch)
+            batch = {}
+
+    if batch:
+        flush(batch)
+
+    instrumentation.metrics.observe_import(counts, perf_counter() - start)
+    if counts["inserted"] or counts["updated"]:
+        live.hub.publish(user_id, lambda: get_current_stats(db, user_id))
+    return counts
+
+# a finished import's response is kept under the client's Idempotency-Key, or the hash
+# of the payload, and returned as is when the same request comes again
+IMPORT_REPLAY_HOURS = float(os.getenv("HEALTHFLOW_IMPORT_REPLAY_HOURS", "24"))
+
+def _import_request_key(idempotency_key: Optional[str], fingerprint: Optional[str]) -> Optional[str]:
+    if idempotency_key:
+        return f"key:{idempotency_key}"
+    if fingerprint:
+        return f"sha256:{fingerprint}"
+    return None
+
+def find_import_result(
+    db: Session,
+    user_id: int,
+    idempotency_key: Optional[str] = None,
+    fingerprint: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    key = _import_request_key(idempotency_key, fingerprint)
+    if key is None:
+        return None
+    request = db.execute(select(models.ImportRequest).where(
+        models.ImportRequest.user_id == user_id,
+        models.ImportRequest.key == key,
+        models.ImportRequest.created_at >= datetime.now() - timedelta(hours=IMPORT_REPLAY_HOURS)
+    )).scalars().first()
+    if request is None:
+        return None
+    if idempotency_key:
+        if fingerprint and request.fingerprint and fingerprint != request.fingerprint:
+            raise ValueError("Idempotency-Key ya usada con otros datos")
+    elif request.data_version != get_data_version(db, user_id):
+        # a matching payload is only a duplicate while nothing else was written since;
+        # otherwise it runs again (and its unchanged rows are skipped row by row)
+        return None
+    return json.loads(request.result)
+
+def record_import_result(
+    db: Session,
+    user_id: int,
+    result: Dict[str, Any],
+    idempotency_key: Optional[str] = None,
+    fingerprint: Optional[str] = None
+):
+    key = _import_request_key(idempotency_key, fingerprint)
+    if key is None:
+        return
+    now = datetime.now()
+    stmt = sqlite_insert(models.ImportRequest).values(
+        user_id=user_id,
+        key=key,
+        fingerprint=fingerprint,
+        data_version=get_data_version(db, user_id),
+        result=json.dumps(result),
+        created_at=now
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "key"],
+        set_={column: stmt.excluded[column] for column in ("fingerprint", "data_version", "result", "created_at")}
+    ))
+    # expired results of the user go on the way
+    db.execute(delete(models.ImportRequest).where(
+        models.ImportRequest.user_id == user_id,
+        models.ImportRequest.created_at < now - timedelta(hours=IMPORT_REPLAY_HOURS)
+    ))
     db.commit()
 
 # dashboard operations
-def get_current_stats(db: Session, user_id: int):
-    today = datetime.now().date()
-    
-    current_weight = db.query(models.Weight).filter(
-        models.Weight.user_id == user_id
-    ).order_by(models.Weight.date.desc()).first()
-
-    current_height = db.query(models.Height).filter(
-        models.Height.user_id == user_id
-    ).order_by(models.Height.date.desc()).first()
-
-    current_composition = db.query(models.BodyComposition).filter(
-        models.BodyComposition.user_id == user_id
-    ).order_by(models.BodyComposition.date.desc()).first()
-
-    # filter for water consumption for the current day
-    today_water = db.query(models.WaterConsumption).filter(
-        models.WaterConsumption.user_id == user_id,
-        func.date(models.WaterConsumption.date) == today
-    ).all()
-    total_water = sum(water.water_amount for water in today_water)
-
-    # filter for steps taken today
-    today_steps = db.query(models.DailySteps).filter(
-        models.DailySteps.user_id == user_id,
-        func.date(models.DailySteps.date) == today
-    ).all()
-    total_steps = sum(steps.steps_amount for steps in today_steps)
-
-    # filter for today's exercises and group them
-    today_exercises = db.query(
-        models.Exercise.exercise_name,
-        func.sum(models.Exercise.duration).label('total_duration')
-    ).filter(
-        models.Exercise.user_id == user_id,
-        func.date(models.Exercise.date) == today
-    ).group_by(
-        models.Exercise.exercise_name
-    ).all()
-
-    current_fat = db.query(models.BodyFatPercentage).filter(
-        models.BodyFatPercentage.user_id == user_id
-    ).order_by(models.BodyFatPercentage.date.desc()).first()
+def _latest_value(metric: metrics.Metric):
+    return select(metric.column).where(
+        metric.model.user_id == bindparam("user_id")
+    ).order_by(metric.model.date.desc()).limit(1).scalar_subquery()
+
+def _day_total(metric: metrics.Metric):
+    return select(func.coalesce(func.sum(metric.column), 0)).where(
+        metric.model.user_id == bindparam("user_id"),
+        metric.model.date >= bindparam("day_start"),
+        metric.model.date < bindparam("day_end")
+    ).scalar_subquery()
+
+def _current_stats_statement():
+    # the whole snapshot, user existence check included, is a single statement:
+    # one row from users with a correlated subquery per stat
+    today_exercises = select(
+        models.Exercise.exercise_name.label("name"),
+        func.sum(models.Exercise.duration).label("duration")
+    ).where(
+        models.Exercise.user_id == bindparam("user_id"),
+        models.Exercise.date >= bindparam("day_start"),
+        models.Exercise.date < bindparam("day_end")
+    ).group_by(models.Exercise.exercise_name).subquery()
+
+    stats = [
+        (_latest_value(metric) if metric.kind == metrics.POINT else _day_total(metric)).label(metric.current)
+        for metric in metrics.CURRENT_METRICS
+    ]
+    return select(
+        *stats,
+        select(func.json_group_array(
+            func.json_object("name", today_exercises.c.name, "duration", today_exercises.c.duration)
+        )).scalar_subquery().label("exercises")
+    ).where(models.User.id == bindparam("user_id"))
+
+CURRENT_STATS = _current_stats_statement()
+
+def current_stats_params(user_id: int) -> Dict[str, Any]:
+    day_start = datetime.combine(datetime.now().date(), time.min)
+    return {"user_id": user_id, "day_start": day_start, "day_end": day_start + timedelta(days=1)}
+
+def build_current_stats(row):
+    if row is None:
+        return None
 
     bmi = None
-    if current_weight and current_height:
-        height_in_meters = current_height.height / 100
-        bmi = current_weight.weight / (height_in_meters ** 2)
+    if row.weight and row.height:
+        height_in_meters = row.height / 100
+        bmi = row.weight / (height_in_meters ** 2)
 
     return {
-        "weight": current_weight.weight if current_weight else None,
-        "height": current_height.height if current_height else None,
+        "weight": row.weight,
+        "height": row.height,
         "bmi": round(bmi, 2) if bmi else None,
         "body_composition": {
-            "fat": current_composition.fat if current_composition else None,
-            "muscle": current_composition.muscle if current_composition else None,
-            "water": current_composition.water if current_composition else None
+            "fat": row.fat,
+            "muscle": row.muscle,
+            "water": row.body_water
         },
-        "fat_percentage": current_fat.fat_percentage if current_fat else None,
-        "water_consumed": total_water,  # sum of today's water intake
-        "steps": total_steps,  # sum of today's steps
+        "fat_percentage": row.fat_percentage,
+        "water_consumed": row.water_consumed,  # sum of today's water intake
+        "steps": row.steps,  # sum of today's steps
         "exercises": [
-            {"name": ex.exercise_name, "duration": int(ex.total_duration)}
-            for ex in today_exercises
+            {"name": ex["name"], "duration": int(ex["duration"])}
+            for ex in json.loads(row.exercises)
         ]
     }
 
+def get_current_stats(db: Session, user_id: int):
+    return build_current_stats(db.execute(CURRENT_STATS, current_stats_params(user_id)).first())
+
 # historical data operations
-def get_metric_history(db: Session, user_id: int, metric_type: str, start_date: datetime):
-    if metric_type == "weight":
-        query = db.query(
-            models.Weight.date,
-            models.Weight.weight.label('value')
-        ).filter(
-            models.Weight.user_id == user_id,
-            models.Weight.date >= start_date
-        ).order_by(models.Weight.date)
-        
-        data = query.all()
-        return [{"date": row.date, "value": float(row.value or 0)} for row in data]
-
-    elif metric_type == "muscle":
-        query = db.query(
-            models.BodyComposition.date,
-            models.BodyComposition.muscle.label('value')
-        ).filter(
-            models.BodyComposition.user_id == user_id,
-            models.BodyComposition.date >= start_date
-        ).order_by(models.BodyComposition.date)
-        
-        data = query.all()
-        return [{"date": row.date, "value": float(row.value or 0)} for row in data]
-
-    elif metric_type == "fat_percentage":
-        query = db.query(
-            models.BodyFatPercentage.date,
-            models.BodyFatPercentage.fat_percentage.label('value')
-        ).filter(
-            models.BodyFatPercentage.user_id == user_id,
-            models.BodyFatPercentage.date >= start_date
-        ).order_by(models.BodyFatPercentage.date)
-        
-        data = query.all()
-        return [{"date": row.date, "value": float(row.value or 0)} for row in data]
-
-    elif metric_type == "water":
-        # Daily water aggregation
-        query = db.query(
-            func.date(models.WaterConsumption.date).label('date'),
-            func.sum(models.WaterConsumption.water_amount).label('value')
-        ).filter(
-            models.WaterConsumption.user_id == user_id,
-            models.WaterConsumption.date >= start_date
-        ).group_by(
-            func.date(models.WaterConsumption.date)
-        ).order_by(
-            func.date(models.WaterConsumption.date)
-        )
-        
-        data = query.all()
-        
-        # Make sure total is not None
-        total = db.query(
-            func.coalesce(func.sum(models.WaterConsumption.water_amount), 0.0)
-        ).filter(
-            models.WaterConsumption.user_id == user_id,
-            models.WaterConsumption.date >= start_date
-        ).scalar()
-        
-        return {
-            "data": [{"date": row.date, "value": float(row.value or 0)} for row in data],
-            "total": float(total)
-        }
+RESOLUTIONS = ("raw", "day", "week", "month")
 
-    elif metric_type == "steps":
-        # Daily steps aggregation
-        query = db.query(
-            func.date(models.DailySteps.date).label('date'),
-            func.sum(models.DailySteps.steps_amount).label('value')
-        ).filter(
-            models.DailySteps.user_id == user_id,
-            models.DailySteps.date >= start_date
-        ).group_by(
-            func.date(models.DailySteps.date)
-        ).order_by(
-            func.date(models.DailySteps.date)
-        )
-        
-        data = query.all()
-        
-        # Make sure total is not None
-        total = db.query(
-            func.coalesce(func.sum(models.DailySteps.steps_amount), 0.0)
-        ).filter(
-            models.DailySteps.user_id == user_id,
-            models.DailySteps.date >= start_date
-        ).scalar()
-        
-        return {
-            "data": [{"date": row.date, "value": float(row.value or 0)} for row in data],
-            "total": float(total)
-        }
+def _bucket(column, resolution: str):
+    if resolution == "day":
+        return func.date(column)
+    if resolution == "week":
+        # monday of the week
+        return func.date(column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", column)
 
-    elif metric_type == "exercise":
-        # Daily exercise aggregation
-        query = db.query(
-            func.date(models.Exercise.date).label('date'),
-            func.sum(models.Exercise.duration).label('value')
-        ).filter(
-            models.Exercise.user_id == user_id,
-            models.Exercise.date >= start_date
-        ).group_by(
-            func.date(models.Exercise.date)
-        ).order_by(
-            func.date(models.Exercise.date)
-        )
-        
-        data = query.all()
-        
-        # Make sure total is not None
-        total = db.query(
-            func.coalesce(func.sum(models.Exercise.duration), 0.0)
-        ).filter(
-            models.Exercise.user_id == user_id,
-            models.Exercise.date >= start_date
-        ).scalar()
-        
+HISTORY_PERIODS = {
+    "1w": timedelta(weeks=1),
+    "1m": timedelta(days=30),
+    "3m": timedelta(days=90),
+    "6m": timedelta(days=180),
+    "1y": timedelta(days=365)
+}
+
+def _point_history_statement(metric: metrics.Metric, resolution: str):
+    model, column = metric.model, metric.column
+    filters = (model.user_id == bindparam("user_id"), model.date >= bindparam("start_date"))
+
+    if resolution == "raw":
+        return select(
+            model.date,
+            column.label('value')
+        ).where(*filters).order_by(model.date)
+
+    # one row per bucket with the average as value, plus the range within the bucket
+    bucket = _bucket(model.date, resolution)
+    return select(
+        bucket.label('date'),
+        func.avg(column).label('value'),
+        func.min(column).label('min'),
+        func.max(column).label('max')
+    ).where(*filters).group_by(bucket).order_by(bucket)
+
+def _cumulative_history_statement(metric_type: str, resolution: str):
+    # daily totals come straight from the rollup table, coarser buckets sum them
+    filters = (
+        models.DailyTotal.user_id == bindparam("user_id"),
+        models.DailyTotal.metric == metric_type,
+        models.DailyTotal.day >= bindparam("start_day")
+    )
+
+    if resolution in ("raw", "day"):
+        return select(
+            models.DailyTotal.day.label('date'),
+            models.DailyTotal.total.label('value')
+        ).where(*filters).order_by(models.DailyTotal.day)
+
+    bucket = _bucket(models.DailyTotal.day, resolution)
+    return select(
+        bucket.label('date'),
+        func.sum(models.DailyTotal.total).label('value')
+    ).where(*filters).group_by(bucket).order_by(bucket)
+
+HISTORY_STATEMENTS = {
+    (metric_type, resolution): (
+        _cumulative_history_statement(metric_type, resolution) if metrics.is_cumulative(metric_type)
+        else _point_history_statement(metrics.METRICS[metric_type], resolution)
+    )
+    for metric_type in metrics.HISTORY_METRICS
+    for resolution in RESOLUTIONS
+}
+
+def history_statement(metric_type: str, resolution: str = "raw"):
+    if resolution not in RESOLUTIONS:
+        raise ValueError("Invalid resolution")
+    if metric_type not in metrics.HISTORY_METRICS:
+        raise ValueError("Invalid metric type")
+    return HISTORY_STATEMENTS[(metric_type, resolution)]
+
+def history_params(user_id: int, start_date: datetime) -> Dict[str, Any]:
+    return {"user_id": user_id, "start_date": start_date, "start_day": start_date.date()}
+
+def _history_point(row):
+    point = {"date": row.date, "value": float(row.value or 0)}
+    if "min" in row._fields and row.min is not None:
+        point["min"] = float(row.min or 0)
+        point["max"] = float(row.max or 0)
+    return point
+
+def build_history(metric_type: str, rows, max_points: Optional[int] = None):
+    data = [_history_point(row) for row in rows]
+
+    if metrics.is_cumulative(metric_type):
+        # total covers the whole period, before any downsampling
+        total = float(sum(row["value"] for row in data))
         return {
-            "data": [{"date": row.date, "value": float(row.value or 0)} for row in data],
-            "total": float(total)
+            "data": downsample.lttb(data, max_points) if max_points else data,
+            "total": total
         }
 
-    else:
-        raise ValueError("Invalid metric type")
\ No newline at end of file
+    return downsample.lttb(data, max_points) if max_points else data
+
+def build_history_columns(metric_type: str, rows, max_points: Optional[int] = None):
+    # same series as build_history, as parallel arrays instead of a dict per row
+    columns = {
+        "dates": [row.date for row in rows],
+        "values": [float(row.value or 0) for row in rows]
+    }
+    if rows and "min" in rows[0]._fields:
+        columns["min"] = [float(row.min or 0) for row in rows]
+        columns["max"] = [float(row.max or 0) for row in rows]
+
+    if metrics.is_cumulative(metric_type):
+        columns["total"] = float(sum(columns["values"]))
+
+    if max_points and len(rows) > max_points:
+        xs = [downsample.timestamp(value) for value in columns["dates"]]
+        keep = downsample.lttb_indices(xs, columns["values"], max_points)
+        for key in ("dates", "values", "min", "max"):
+            if key in columns:
+                columns[key] = [columns[key][i] for i in keep]
+
+    return columns
+
+HistoryRow = namedtuple("HistoryRow", ["date", "value", "min", "max"])
+RawRow = namedtuple("RawRow", ["date", "value"])
+
+def _reads_archive(metric_type: str, start_date: datetime) -> bool:
+    # cumulative history comes from daily_totals, which stay live
+    return metric_type in metrics.POINT_METRICS and archive.reaches_archive(start_date)
+
+def _bucket_key(value: datetime, resolution: str) -> str:
+    # same buckets as _bucket, in python
+    day = value.date()
+    if resolution == "week":
+        day -= timedelta(days=day.weekday())
+    elif resolution == "month":
+        day = day.replace(day=1)
+    return day.isoformat()
+
+def _merged_history_rows(db: Session, user_id: int, metric_type: str, start_date: datetime, resolution: str):
+    # raw rows from the live table and the archive, bucketed here when needed
+    history_statement(metric_type, resolution)
+    metric = metrics.METRICS[metric_type]
+    value_index = list(metrics.IMPORT_MODELS[metric.import_type][1].model_fields).index(metric.column.key)
+    live = db.execute(history_statement(metric_type, "raw"), history_params(user_id, start_date)).all()
+    rows = sorted(
+        [RawRow(row[0], row[value_index]) for row in archive.iter_rows(db, user_id, metric.import_type, start_date)] +
+        [RawRow(row.date, row.value) for row in live]
+    )
+    if resolution == "raw":
+        return rows
+
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(_bucket_key(row.date, resolution), []).append(row.value)
+    return [
+        HistoryRow(key, sum(values) / len(values), min(values), max(values))
+        for key, values in sorted(buckets.items())
+    ]
+
+def _history_rows(db: Session, user_id: int, metric_type: str, start_date: datetime, resolution: str):
+    if _reads_archive(metric_type, start_date):
+        return _merged_history_rows(db, user_id, metric_type, start_date, resolution)
+    stmt = history_statement(metric_type, resolution)
+    return db.execute(stmt, history_params(user_id, start_date)).all()
+
+def get_metric_history(
+    db: Session,
+    user_id: int,
+    metric_type: str,
+    start_date: datetime,
+    resolution: str = "raw",
+    max_points: Optional[int] = None
+):
+    return build_history(metric_type, _history_rows(db, user_id, metric_type, start_date, resolution), max_points)
+
+def get_metric_history_columns(
+    db: Session,
+    user_id: int,
+    metric_type: str,
+    start_date: datetime,
+    resolution: str = "raw",
+    max_points: Optional[int] = None
+):
+    return build_history_columns(metric_type, _history_rows(db, user_id, metric_type, start_date, resolution), max_points)
+
+@lru_cache(maxsize=256)
+def history_batch_statement(metric_types: Tuple[str, ...], resolution: str = "raw"):
+    # every series in one UNION ALL, normalized to (metric, date, value, min, max);
+    # dates come back as stored text since raw and bucketed series mix in one column.
+    # built once per combination of metrics the dashboard asks for
+    parts = []
+    for metric_type in metric_types:
+        series = history_statement(metric_type, resolution).subquery()
+        parts.append(select(
+            literal(metric_type).label("metric"),
+            type_coerce(series.c.date, String).label("date"),
+            series.c.value,
+            (series.c.min if "min" in series.c else null()).label("min"),
+            (series.c.max if "max" in series.c else null()).label("max")
+        ))
+    return union_all(*parts).order_by(literal_column("metric"), literal_column("date"))
+
+def build_history_batch(metric_types: List[str], rows, resolution: str = "raw", max_points: Optional[int] = None):
+    series = {metric_type: [] for metric_type in metric_types}
+    for row in rows:
+        row_date = row.date
+        # raw point metrics carry full timestamps, same as the single-metric endpoint
+        if not metrics.is_cumulative(row.metric) and resolution == "raw":
+            row_date = datetime.fromisoformat(row_date)
+        series[row.metric].append(HistoryRow(row_date, row.value, row.min, row.max))
+    return {
+        metric_type: build_history(metric_type, metric_rows, max_points)
+        for metric_type, metric_rows in series.items()
+    }
+
+def get_metric_history_batch(
+    db: Session,
+    user_id: int,
+    metric_types: List[str],
+    start_date: datetime,
+    resolution: str = "raw",
+    max_points: Optional[int] = None
+):
+    if not metric_types:
+        return {}
+    # series reaching into the archive are merged one by one, the rest share the union
+    archived = [metric_type for metric_type in metric_types if _reads_archive(metric_type, start_date)]
+    live = [metric_type for metric_type in metric_types if metric_type not in archived]
+    result = {}
+    if live:
+        stmt = history_batch_statement(tuple(live), resolution)
+        rows = db.execute(stmt, history_params(user_id, start_date)).all()
+        result = build_history_batch(live, rows, resolution, max_points)
+    for metric_type in archived:
+        rows = _merged_history_rows(db, user_id, metric_type, start_date, resolution)
+        result[metric_type] = build_history(metric_type, rows, max_points)
+    return {metric_type: result[metric_type] for metric_type in metric_types}
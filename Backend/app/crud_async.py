@@ -0,0 +1,111 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, schemas, cache, crud, archive, derived
+from .crud import (
+    DATA_VERSION,
+    BUMP_DATA_VERSION,
+    CURRENT_STATS,
+    current_stats_params,
+    build_current_stats,
+    history_statement,
+    history_params,
+    build_history,
+    build_history_columns,
+    history_batch_statement,
+    build_history_batch
+)
+
+# async versions of the crud functions behind the user and dashboard endpoints,
+# sharing statement construction and result shaping with crud.py. history reaching
+# past the archive horizon (cold path, file reads) runs the sync version via run_sync
+
+async def get_user(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.User).where(models.User.id == user_id))
+    return result.scalars().first()
+
+async def get_data_version(db: AsyncSession, user_id: int) -> Optional[int]:
+    return (await db.execute(DATA_VERSION, {"user_id": user_id})).scalar()
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, password_hash: str):
+    db_user = models.User(
+        email=user.email,
+        username=user.username,
+        password=password_hash,
+        birthday=user.birthday,
+        gender=user.gender
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+
+    # add initial weight and height, with their derived series like the sync version
+    weight = models.Weight(date=datetime.now(), user_id=db_user.id, weight=user.current_weight)
+    db.add(weight)
+    db.add(models.Height(date=datetime.now(), user_id=db_user.id, height=user.current_height))
+    await db.flush()
+    today = weight.date.date()
+    await db.run_sync(derived.refresh_for_import, db_user.id, "weight", today, today)
+    await db.execute(BUMP_DATA_VERSION, {"user_id": db_user.id})
+    await db.commit()
+    cache.response_cache.invalidate_user(db_user.id)
+
+    return db_user
+
+async def update_password(db: AsyncSession, db_user: models.User, password_hash: str):
+    db_user.password = password_hash
+    await db.commit()
+
+async def get_current_stats(db: AsyncSession, user_id: int):
+    result = await db.execute(CURRENT_STATS, current_stats_params(user_id))
+    return build_current_stats(result.first())
+
+async def get_metric_history(
+    db: AsyncSession,
+    user_id: int,
+    metric_type: str,
+    start_date: datetime,
+    resolution: str = "raw",
+    max_points: Optional[int] = None
+):
+    if archive.reaches_archive(start_date):
+        return await db.run_sync(crud.get_metric_history, user_id, metric_type, start_date, resolution, max_points)
+    result = await db.execute(history_statement(metric_type, resolution), history_params(user_id, start_date))
+    return build_history(metric_type, result.all(), max_points)
+
+async def get_metric_history_columns(
+    db: AsyncSession,
+    user_id: int,
+    metric_type: str,
+    start_date: datetime,
+    resolution: str = "raw",
+    max_points: Optional[int] = None
+):
+    if archive.reaches_archive(start_date):
+        return await db.run_sync(crud.get_metric_history_columns, user_id, metric_type, start_date, resolution, max_points)
+    result = await db.execute(history_statement(metric_type, resolution), history_params(user_id, start_date))
+    return build_history_columns(metric_type, result.all(), max_points)
+
+async def get_metric_history_batch(
+    db: AsyncSession,
+    user_id: int,
+    metric_types: List[str],
+    start_date: datetime,
+    resolution: str = "raw",
+    max_points: Optional[int] = None
+):
+    if not metric_types:
+        return {}
+    if archive.reaches_archive(start_date):
+        return await db.run_sync(crud.get_metric_history_batch, user_id, metric_types, start_date, resolution, max_points)
+    result = await db.execute(history_batch_statement(tuple(metric_types), resolution), history_params(user_id, start_date))
+    return build_history_batch(metric_types, result.all(), resolution, max_points)
@@ -0,0 +1,130 @@
+import logging
+import os
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# uvicorn only configures its own loggers, this one shows up in the startup output
+logger = logging.getLogger("uvicorn.error")
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+class DatabaseSettings:
+    def __init__(self):
+        self.url = os.getenv("HEALTHFLOW_DATABASE_URL", "sqlite:///./health_tracker.db")
+        self.journal_mode = os.getenv("HEALTHFLOW_DB_JOURNAL_MODE", "WAL")
+        self.synchronous = os.getenv("HEALTHFLOW_DB_SYNCHRONOUS", "NORMAL")
+        self.busy_timeout_ms = int(os.getenv("HEALTHFLOW_DB_BUSY_TIMEOUT_MS", "5000"))
+        self.cache_size_kb = int(os.getenv("HEALTHFLOW_DB_CACHE_SIZE_KB", "20000"))
+        self.mmap_size = int(os.getenv("HEALTHFLOW_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+        self.pool_size = int(os.getenv("HEALTHFLOW_DB_POOL_SIZE", "5"))
+        self.max_overflow = int(os.getenv("HEALTHFLOW_DB_MAX_OVERFLOW", "10"))
+        self.pool_timeout = float(os.getenv("HEALTHFLOW_DB_POOL_TIMEOUT", "30"))
+        # separate query_only pool for the dashboard reads
+        self.read_pool = _env_bool("HEALTHFLOW_DB_READ_POOL", False)
+        self.read_pool_size = int(os.getenv("HEALTHFLOW_DB_READ_POOL_SIZE", "10"))
+        # serve the user and dashboard endpoints from an AsyncSession over aiosqlite
+        self.async_db = _env_bool("HEALTHFLOW_DB_ASYNC", False)
+
+settings = DatabaseSettings()
+
+def set_pragmas(engine, read_only: bool = False):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.busy_timeout_ms}")
+        # negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{settings.cache_size_kb}")
+        cursor.execute(f"PRAGMA mmap_size={settings.mmap_size}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+def make_engine(pool_size: int, read_only: bool = False, url: Optional[str] = None):
+    engine = create_engine(
+        url or settings.url,
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout
+    )
+    set_pragmas(engine, read_only)
+    return engine
+
+def make_async_engine():
+    # aiosqlite is only needed when the async stack is enabled
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(
+        settings.url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout
+    )
+    set_pragmas(engine.sync_engine)
+    return engine
+
+engine = make_engine(settings.pool_size)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+if settings.read_pool:
+    read_engine = make_engine(settings.read_pool_size, read_only=True)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+else:
+    read_engine = engine
+    ReadSessionLocal = SessionLocal
+
+if settings.async_db:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    async_engine = make_async_engine()
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+
+def all_engines():
+    # sync engines only: the async one is reached through its sync_engine for events
+    engines = [engine]
+    if read_engine is not engine:
+        engines.append(read_engine)
+    if async_engine is not None:
+        engines.append(async_engine.sync_engine)
+    return engines
+
+def log_settings():
+    with engine.connect() as conn:
+        effective = {
+            pragma: conn.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size")
+        }
+    logger.info(
+        "Database %s: %s, pool_size=%d, max_overflow=%d, read_pool=%s, async=%s",
+        settings.url,
+        ", ".join(f"{key}={value}" for key, value in effective.items()),
+        settings.pool_size,
+        settings.max_overflow,
+        f"size {settings.read_pool_size}" if settings.read_pool else "off",
+        "on" if settings.async_db else "off"
+    )
+
+# dependencies
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,226 @@
+import argparse
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Dict
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import models, metrics, rollups, archive
+
+# point metrics are averaged per day, cumulative ones reuse the daily totals
+DAILY_POINT_METRICS = metrics.POINT_METRICS
+
+DERIVED_METRICS = ("bmi",) + tuple(DAILY_POINT_METRICS) + tuple(rollups.ROLLUP_METRICS)
+
+BMI_INPUTS = ("weight", "height")
+
+# derived series affected by each import type
+IMPORT_DEPENDENCIES = {
+    import_type: tuple(name for name in names if name in DERIVED_METRICS) + (("bmi",) if import_type in BMI_INPUTS else ())
+    for import_type, names in metrics.IMPORT_METRICS.items()
+}
+
+MOVING_AVERAGE_DAYS = 7
+
+# rows per upsert, same bound parameter concern as the imports
+UPSERT_BATCH_SIZE = 500
+
+def _day_range(first_day: date, last_day: date):
+    return datetime.combine(first_day, time.min), datetime.combine(last_day + timedelta(days=1), time.min)
+
+def _daily_values(db: Session, user_id: int, metric: str, first_day: date, last_day: date) -> Dict[date, float]:
+    if metric in rollups.ROLLUP_METRICS:
+        rows = db.execute(select(models.DailyTotal.day, models.DailyTotal.total).where(
+            models.DailyTotal.user_id == user_id,
+            models.DailyTotal.metric == metric,
+            models.DailyTotal.day >= first_day,
+            models.DailyTotal.day <= last_day
+        )).all()
+        return {row.day: row.total for row in rows}
+
+    model, column = DAILY_POINT_METRICS[metric]
+    start, end = _day_range(first_day, last_day)
+    day = func.date(model.date)
+    rows = db.execute(select(day.label("day"), func.sum(column).label("total"), func.count(column).label("count")).where(
+        model.user_id == user_id,
+        model.date >= start,
+        model.date < end
+    ).group_by(day)).all()
+    sums = {date.fromisoformat(row.day): [row.total, row.count] for row in rows if row.count}
+
+    # archived months count too (a day can have rows on both sides: archiving keeps
+    # the latest row live), otherwise a full refresh would drop or skew them
+    import_type = metrics.METRICS[metric].import_type
+    position = list(metrics.IMPORT_MODELS[import_type][1].model_fields).index(column.key)
+    for row in archive.iter_rows(db, user_id, import_type, start, end):
+        if row[position] is None:
+            continue
+        day_sum = sums.setdefault(row[0].date(), [0.0, 0])
+        day_sum[0] += row[position]
+        day_sum[1] += 1
+    return {day: total / count for day, (total, count) in sums.items()}
+
+def _daily_bmi(db: Session, user_id: int, first_day: date, last_day: date) -> Dict[date, float]:
+    # as-of join: each day's average weight with the most recent height measured
+    # by the end of that day; weights older than every height use the first one
+    weights = _daily_values(db, user_id, "weight", first_day, last_day)
+    heights = db.execute(select(models.Height.date, models.Height.height).where(
+        models.Height.user_id == user_id,
+        models.Height.height > 0
+    ).order_by(models.Height.date)).all()
+    if not weights or not heights:
+        return {}
+
+    height_dates = [row.date for row in heights]
+    bmi = {}
+    for day, weight in weights.items():
+        index = max(bisect_right(height_dates, datetime.combine(day, time.max)) - 1, 0)
+        height_in_meters = heights[index].height / 100
+        bmi[day] = weight / (height_in_meters ** 2)
+    return bmi
+
+def _series(db: Session, user_id: int, metric: str, first_day: date, last_day: date):
+    if metric == "bmi":
+        return _daily_bmi(db, user_id, first_day, last_day)
+    return _daily_values(db, user_id, metric, first_day, last_day)
+
+def _bounds(db: Session, user_id: int, metric: str):
+    # first and last day with source data for a derived series
+    if metric in rollups.ROLLUP_METRICS:
+        low, high = db.execute(select(func.min(models.DailyTotal.day), func.max(models.DailyTotal.day)).where(
+            models.DailyTotal.user_id == user_id,
+            models.DailyTotal.metric == metric
+        )).one()
+        return (low, high) if low else None
+
+    source = "weight" if metric == "bmi" else metric
+    model, _ = DAILY_POINT_METRICS[source]
+    low, high = db.execute(select(func.min(model.date), func.max(model.date)).where(
+        model.user_id == user_id
+    )).one()
+    days = [moment.date() for moment in (low, high) if moment]
+
+    # the oldest rows may be archived: the first and last archived months hold the ends
+    import_type = metrics.METRICS[source].import_type
+    months = archive.archived_months(db, user_id, import_type)
+    for month in dict.fromkeys(months[:1] + months[-1:]):
+        days += [row[0].date() for row in archive.read_month(user_id, import_type, month)]
+    return (min(days), max(days)) if days else None
+
+def refresh_derived(db: Session, user_id: int, metric: str, first_day: date, last_day: date):
+    # a day's moving average looks 6 days back, so a change on [first_day, last_day]
+    # reaches 6 days forward and needs 6 days of history before it
+    window = timedelta(days=MOVING_AVERAGE_DAYS - 1)
+    values = _series(db, user_id, metric, first_day - window, last_day + window)
+
+    rows = []
+    for day in sorted(values):
+        if day < first_day:
+            continue
+        recent = [values[d] for d in (day - timedelta(days=k) for k in range(MOVING_AVERAGE_DAYS)) if d in values]
+        rows.append({
+            "user_id": user_id,
+            "metric": metric,
+            "day": day,
+            "value": values[day],
+            "avg_7d": sum(recent) / len(recent)
+        })
+
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = sqlite_insert(models.DailyMetric).values(rows[start:start + UPSERT_BATCH_SIZE])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "metric", "day"],
+            set_={"value": stmt.excluded.value, "avg_7d": stmt.excluded.avg_7d}
+        ))
+
+def refresh_for_import(db: Session, user_id: int, import_type: str, first_day: date, last_day: date):
+    for metric in IMPORT_DEPENDENCIES.get(import_type, ()):
+        if import_type == "height":
+            # a new height can change bmi for any weight, so the whole series is redone
+            bounds = _bounds(db, user_id, metric)
+            if bounds:
+                refresh_derived(db, user_id, metric, *bounds)
+        else:
+            refresh_derived(db, user_id, metric, first_day, last_day)
+
+def backfill_derived_metrics(db: Session):
+    # rebuild every derived series from scratch; run after the daily totals backfill
+    db.query(models.DailyMetric).delete()
+    for (user_id,) in db.query(models.User.id).all():
+        for metric in DERIVED_METRICS:
+            bounds = _bounds(db, user_id, metric)
+            if bounds:
+                refresh_derived(db, user_id, metric, *bounds)
+        db.execute(update(models.User).where(models.User.id == user_id).values(
+            data_version=models.User.data_version + 1
+        ))
+        db.commit()
+
+def linear_trend(rows):
+    # least squares line over the daily values, x in days since the first point
+    if len(rows) < 2:
+        return None
+    first_day = rows[0].date
+    xs = [(row.date - first_day).days for row in rows]
+    ys = [row.value for row in rows]
+    n = len(rows)
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if variance == 0:
+        return None
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+    intercept = mean_y - slope * mean_x
+    return {
+        "slope_per_day": round(slope, 4),
+        "start": round(intercept, 2),
+        "end": round(intercept + slope * xs[-1], 2)
+    }
+
+def derived_statement(user_id: int, metric: str, start_day: date):
+    return select(
+        models.DailyMetric.day.label("date"),
+        models.DailyMetric.value,
+        models.DailyMetric.avg_7d
+    ).where(
+        models.DailyMetric.user_id == user_id,
+        models.DailyMetric.metric == metric,
+        models.DailyMetric.day >= start_day
+    ).order_by(models.DailyMetric.day)
+
+def get_derived_series(db: Session, user_id: int, metric: str, start_day: date):
+    if metric not in DERIVED_METRICS:
+        raise ValueError("Invalid metric type")
+    rows = db.execute(derived_statement(user_id, metric, start_day)).all()
+    return {
+        "data": [
+            {"date": row.date, "value": round(row.value, 2), "avg_7d": round(row.avg_7d, 2)}
+            for row in rows
+        ],
+        "trend": linear_trend(rows)
+    }
+
+if __name__ == "__main__":
+    # python -m app.derived backfill
+    parser = argparse.ArgumentParser(description="Mantenimiento de las métricas derivadas")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+
+    from .database import engine
+    from .migrations import upgrade
+    from .storage import backend
+    from .archive import has_archives
+    upgrade(engine)
+    for shard_engine in backend.engines():
+        upgrade(shard_engine)
+    # the backfill rebuilds from the live tables only
+    for session_factory in backend.sessionmakers():
+        with session_factory() as db:
+            if has_archives(db):
+                parser.error("hay meses archivados; restaurarlos antes con: python -m app.archive restore --all")
+    for session_factory in backend.sessionmakers():
+        db = session_factory()
+        try:
+            backfill_derived_metrics(db)
+        finally:
+            db.close()
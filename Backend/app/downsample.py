@@ -0,0 +1,54 @@
+from datetime import date, datetime
+from typing import List, Dict, Any
+
+# largest-triangle-three-buckets: keeps the visual shape of a series while
+# bounding it to max_points, so long periods don't ship thousands of points
+
+def timestamp(value) -> float:
+    # history dates are datetimes (raw rows), dates (rollups) or 'YYYY-MM-DD' text (buckets)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time()).timestamp()
+    return datetime.fromisoformat(str(value)).timestamp()
+
+def lttb_indices(xs: List[float], ys: List[float], max_points: int) -> List[int]:
+    if max_points >= len(xs) or max_points < 3:
+        return list(range(len(xs)))
+
+    # first and last points are always kept, the rest is split into max_points - 2 buckets
+    selected = [0]
+    bucket_size = (len(xs) - 2) / (max_points - 2)
+    previous = 0
+
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # average of the next bucket is the third vertex of the triangle
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, len(xs))
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(
+                (xs[previous] - avg_x) * (ys[j] - ys[previous]) -
+                (xs[previous] - xs[j]) * (avg_y - ys[previous])
+            )
+            if area > best_area:
+                best, best_area = j, area
+
+        selected.append(best)
+        previous = best
+
+    selected.append(len(xs) - 1)
+    return selected
+
+def lttb(points: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    if max_points >= len(points) or max_points < 3:
+        return points
+    xs = [timestamp(point["date"]) for point in points]
+    ys = [point["value"] for point in points]
+    return [points[i] for i in lttb_indices(xs, ys, max_points)]
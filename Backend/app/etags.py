@@ -0,0 +1,44 @@
+import hashlib
+from typing import Optional
+from fastapi import HTTPException, Request, Response
+
+# weak ETags for the dashboard: the user's data_version plus whatever else shapes the
+# response (route, query parameters, today's date for the windows that roll over), so
+# a repeat view of unchanged data is answered with a 304 before any metric query runs
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(user_id: int, version: int, *key) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f'W/"{user_id}.{version}.{digest}"'
+
+def matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # weak comparison: W/"x" and "x" match
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def set_headers(response: Response, etag: str, vary: Optional[str] = None) -> Response:
+    # no-cache lets the browser keep the body but revalidate it on every use; vary names
+    # the request headers the body depends on (Accept where the format is negotiated)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if vary:
+        response.headers["Vary"] = vary
+    return response
+
+def not_modified(etag: str, vary: Optional[str] = None) -> Response:
+    return set_headers(Response(status_code=304), etag, vary)
+
+def evaluate(request: Request, response: Response, user_id: int, version: Optional[int], *key, vary: Optional[str] = None):
+    # (etag, 304 response if the client's copy is current, else None); the etag is
+    # also set on the injected response for the handler's normal return. a negotiated
+    # format has to be part of the key, so each representation has its own etag
+    if version is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    etag = make_etag(user_id, version, *key)
+    if matches(request, etag):
+        return etag, not_modified(etag, vary)
+    set_headers(response, etag, vary)
+    return etag, None
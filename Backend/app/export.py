@@ -0,0 +1,118 @@
+import csv
+import heapq
+import io
+import json
+import os
+import zipfile
+from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Iterator, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import archive, crud
+
+# streaming export: each metric table is read through yield_per (sqlite's cursor steps
+# through the rows instead of fetching them all) and written out one partition at a
+# time, so memory stays at one partition and the first bytes leave right away
+EXPORT_CHUNK_ROWS = int(os.getenv("HEALTHFLOW_EXPORT_CHUNK_ROWS", "5000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "zip": "application/zip"
+}
+
+def export_statement(user_id: int, import_type: str):
+    # same columns, in the same order, as the import schema
+    model, schema = crud.IMPORT_MODELS[import_type]
+    return select(*(getattr(model, field) for field in schema.model_fields)).where(
+        model.user_id == user_id
+    ).order_by(model.date)
+
+def _partitions(db: Session, user_id: int, import_type: str):
+    # archived months merged in by date, then regrouped into partitions
+    archived = archive.iter_rows(db, user_id, import_type)
+    stmt = export_statement(user_id, import_type).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    live = (row for partition in db.execute(stmt).partitions() for row in partition)
+    rows = heapq.merge(archived, live, key=itemgetter(0))
+    while True:
+        partition = list(islice(rows, EXPORT_CHUNK_ROWS))
+        if not partition:
+            return
+        yield partition
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def iter_ndjson(db: Session, user_id: int, import_types: List[str]) -> Iterator[bytes]:
+    # one object per line, tagged with its import type
+    for import_type in import_types:
+        fields = list(crud.IMPORT_MODELS[import_type][1].model_fields)
+        for partition in _partitions(db, user_id, import_type):
+            yield "".join(
+                json.dumps({"type": import_type, **{field: _plain(value) for field, value in zip(fields, row)}}) + "\n"
+                for row in partition
+            ).encode()
+
+def iter_csv(db: Session, user_id: int, import_type: str) -> Iterator[bytes]:
+    # header plus positional columns, so the file goes straight back into the csv import
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(crud.IMPORT_MODELS[import_type][1].model_fields)
+    for partition in _partitions(db, user_id, import_type):
+        writer.writerows([_plain(value) for value in row] for row in partition)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+class _ZipBuffer:
+    # write-only file for ZipFile: without tell/seek it writes data descriptors,
+    # and whatever has been written so far can be handed out and dropped
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_zip(db: Session, user_id: int, import_types: List[str]) -> Iterator[bytes]:
+    # one csv per metric
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for import_type in import_types:
+            with zip_file.open(f"{import_type}.csv", mode="w", force_zip64=True) as entry:
+                for chunk in iter_csv(db, user_id, import_type):
+                    entry.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+    yield buffer.pop()
+
+def export_user_data(
+    session_factory: Callable[..., Session],
+    user_id: int,
+    data_format: str,
+    import_types: List[str]
+) -> Iterator[bytes]:
+    # the generator owns its session: it outlives the request handler
+    db = session_factory(user_id, read_only=True)
+    try:
+        if data_format == "ndjson":
+            yield from iter_ndjson(db, user_id, import_types)
+        elif data_format == "csv":
+            yield from iter_csv(db, user_id, import_types[0])
+        else:
+            yield from iter_zip(db, user_id, import_types)
+    finally:
+        db.close()
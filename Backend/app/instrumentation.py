@@ -0,0 +1,161 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import event
+
+logger = logging.getLogger("uvicorn.error")
+
+# statements slower than this are logged with their parameters
+SLOW_QUERY_MS = float(os.getenv("HEALTHFLOW_SLOW_QUERY_MS", "100"))
+
+# bulk inserts can carry thousands of parameters, the log only gets the start
+MAX_LOGGED_CHARS = 500
+
+# per-statement timings kept per request, the counters keep going past it
+MAX_STATEMENTS_PER_REQUEST = 100
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = []  # (sql, seconds)
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.sql_seconds += seconds
+        if len(self.statements) < MAX_STATEMENTS_PER_REQUEST:
+            self.statements.append((statement, seconds))
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+class Metrics:
+    # minimal prometheus text exposition, no client library needed
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.latency_sum = defaultdict(float)
+        self.latency_count = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.db_queries = defaultdict(int)
+        self.slow_queries = 0
+        self.import_rows = defaultdict(int)
+        self.import_seconds = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route, str(status))
+        with self.lock:
+            buckets = self.latency[key]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self.latency_sum[key] += seconds
+            self.latency_count[key] += 1
+            self.db_seconds[(method, route)] += stats.sql_seconds
+            self.db_queries[(method, route)] += stats.queries
+
+    def observe_slow_query(self):
+        with self.lock:
+            self.slow_queries += 1
+
+    def observe_import(self, counts: dict, seconds: float):
+        with self.lock:
+            for outcome, rows in counts.items():
+                self.import_rows[outcome] += rows
+            self.import_seconds += seconds
+
+    def render(self, extra_lines=()):
+        lines = []
+        with self.lock:
+            lines.append("# HELP healthflow_request_duration_seconds Request latency by route")
+            lines.append("# TYPE healthflow_request_duration_seconds histogram")
+            for (method, route, status), buckets in sorted(self.latency.items()):
+                labels = f'method="{method}",route="{route}",status="{status}"'
+                for bound, count in zip(LATENCY_BUCKETS, buckets):
+                    lines.append(f'healthflow_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                count = self.latency_count[(method, route, status)]
+                lines.append(f'healthflow_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"healthflow_request_duration_seconds_sum{{{labels}}} {self.latency_sum[(method, route, status)]}")
+                lines.append(f"healthflow_request_duration_seconds_count{{{labels}}} {count}")
+
+            lines.append("# HELP healthflow_db_seconds_total Time spent in SQL by route")
+            lines.append("# TYPE healthflow_db_seconds_total counter")
+            for (method, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'healthflow_db_seconds_total{{method="{method}",route="{route}"}} {seconds}')
+
+            lines.append("# HELP healthflow_db_queries_total SQL statements by route")
+            lines.append("# TYPE healthflow_db_queries_total counter")
+            for (method, route), queries in sorted(self.db_queries.items()):
+                lines.append(f'healthflow_db_queries_total{{method="{method}",route="{route}"}} {queries}')
+
+            lines.append("# HELP healthflow_slow_queries_total Statements slower than HEALTHFLOW_SLOW_QUERY_MS")
+            lines.append("# TYPE healthflow_slow_queries_total counter")
+            lines.append(f"healthflow_slow_queries_total {self.slow_queries}")
+
+            # rows/sec is rate(healthflow_import_rows_total) or rows_total / seconds_total
+            lines.append("# HELP healthflow_import_rows_total Imported rows by outcome")
+            lines.append("# TYPE healthflow_import_rows_total counter")
+            for outcome, rows in sorted(self.import_rows.items()):
+                lines.append(f'healthflow_import_rows_total{{outcome="{outcome}"}} {rows}')
+            lines.append("# HELP healthflow_import_seconds_total Time spent importing")
+            lines.append("# TYPE healthflow_import_seconds_total counter")
+            lines.append(f"healthflow_import_seconds_total {self.import_seconds}")
+
+        lines.extend(extra_lines)
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.record(statement, seconds)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            metrics.observe_slow_query()
+            logger.warning(
+                "Slow query (%.1f ms): %s %s",
+                seconds * 1000,
+                statement[:MAX_LOGGED_CHARS],
+                str(parameters)[:MAX_LOGGED_CHARS]
+            )
+
+def install(app, engines):
+    for engine in engines:
+        instrument_engine(engine)
+
+    @app.middleware("http")
+    async def record_request(request: Request, call_next):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            current_request.reset(token)
+        seconds = time.perf_counter() - start
+
+        # the route template keeps the label set bounded (no raw user ids)
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        metrics.observe_request(request.method, route_path, response.status_code, seconds, stats)
+
+        slowest = max((duration for _, duration in stats.statements), default=0.0)
+        response.headers["Server-Timing"] = ", ".join([
+            f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.queries} queries"',
+            f"db-max;dur={slowest * 1000:.2f}",
+            f"total;dur={seconds * 1000:.2f}"
+        ])
+        return response
@@ -0,0 +1,97 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from . import crud
+
+# background imports run on their own small pool, separate from the threadpool that
+# serves the sync endpoints, so a queue of big imports can't starve dashboard requests
+IMPORT_WORKERS = int(os.getenv("HEALTHFLOW_IMPORT_WORKERS", "2"))
+
+# finished jobs kept around for polling before the oldest are dropped
+MAX_FINISHED_JOBS = 1000
+
+class ImportJobManager:
+    def __init__(self, session_factory, max_workers: int = IMPORT_WORKERS):
+        self.session_factory = session_factory
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="import-job")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, user_id: int, import_type: str, data: List[Dict[str, Any]]):
+        if import_type not in crud.IMPORT_MODELS:
+            raise ValueError("Invalid import type")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "import_type": import_type,
+            "status": "queued",
+            "total": len(data),
+            "processed": 0,
+            "inserted": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "rejected": 0,
+            "error": None,
+            "created_at": datetime.now(),
+            "finished_at": None
+        }
+        with self.lock:
+            self.jobs[job["job_id"]] = job
+            self._prune()
+            snapshot = dict(job)
+        self.executor.submit(self._run, job["job_id"], user_id, import_type, data)
+        return snapshot
+
+    def get(self, user_id: int, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["user_id"] != user_id:
+                return None
+            return dict(job)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _update(self, job_id: str, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def _on_batch(self, job_id: str, counts: Dict[str, int]):
+        self._update(job_id, processed=sum(counts.values()), **counts)
+
+    def _run(self, job_id: str, user_id: int, import_type: str, data: List[Dict[str, Any]]):
+        self._update(job_id, status="running")
+        db = self.session_factory(user_id)
+        try:
+            counts = crud.import_user_data(
+                db=db,
+                user_id=user_id,
+                import_type=import_type,
+                data=data,
+                on_batch=lambda counts: self._on_batch(job_id, counts)
+            )
+            self._update(
+                job_id,
+                status="completed",
+                processed=sum(counts.values()),
+                finished_at=datetime.now(),
+                **counts
+            )
+        except Exception as e:
+            db.rollback()
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now())
+        finally:
+            db.close()
+
+    def _prune(self):
+        finished = [
+            job_id for job_id, job in self.jobs.items()
+            if job["status"] in ("completed", "failed")
+        ]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+# push channel for the overview: a client keeps one Server-Sent Events stream open per
+# user and receives the fields of the current stats that changed after each import,
+# instead of polling /current. the hub lives on the event loop with one small queue per
+# connection and no thread, so idle connections cost a task and a queue each. it's per
+# process: with several uvicorn workers a client only hears about the imports its own
+# worker ran
+HEARTBEAT_SECONDS = float(os.getenv("HEALTHFLOW_LIVE_HEARTBEAT_SECONDS", "15"))
+QUEUE_SIZE = int(os.getenv("HEALTHFLOW_LIVE_QUEUE_SIZE", "16"))
+
+def delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    # fields of new that differ from old, nested dicts (body_composition) field by field
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = delta(previous, value)
+            if nested:
+                changes[key] = nested
+        elif key not in old or value != previous:
+            changes[key] = value
+    return changes
+
+def _event(name: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+class LiveHub:
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.loop = None
+        # user_id -> queues of its open streams, and the last stats they were sent;
+        # only touched on the event loop
+        self.subscribers = {}
+        self.state = {}
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[user_id]
+            self.state.pop(user_id, None)
+
+    def snapshot(self, user_id: int, queue: asyncio.Queue, stats: Dict[str, Any]) -> Dict[str, Any]:
+        # a new stream starts from the stats it just queried, which can be newer than the
+        # hub's (midnight rollover, an import on another worker); the streams already open
+        # get the difference so they stay lined up with the deltas that follow
+        if user_id in self.state:
+            self._dispatch(user_id, stats, skip=queue)
+        else:
+            self.state[user_id] = stats
+        return stats
+
+    def publish(self, user_id: int, current_stats: Callable[[], Optional[Dict[str, Any]]]):
+        # called from import threads after the commit; the stats query only runs
+        # when the user has a stream open
+        if self.loop is None or self.loop.is_closed() or user_id not in self.subscribers:
+            return
+        stats = current_stats()
+        if stats is not None:
+            self.loop.call_soon_threadsafe(self._dispatch, user_id, stats)
+
+    def _dispatch(self, user_id: int, stats: Dict[str, Any], skip: Optional[asyncio.Queue] = None):
+        queues = self.subscribers.get(user_id)
+        if not queues:
+            return
+        changes = delta(self.state.get(user_id, {}), stats)
+        self.state[user_id] = stats
+        if not changes:
+            return
+        for queue in queues:
+            if queue is skip:
+                continue
+            try:
+                queue.put_nowait(("delta", changes))
+            except asyncio.QueueFull:
+                # the client stopped reading: drop its backlog and resend the full state
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", stats))
+
+    async def stream(self, user_id: int, queue: asyncio.Queue, initial: Dict[str, Any]) -> AsyncIterator[bytes]:
+        # comments keep proxies from timing out idle streams and surface disconnects;
+        # the stream is cancelled when the client goes away
+        try:
+            yield _event("snapshot", initial)
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if message is None:
+                    return
+                yield _event(*message)
+        finally:
+            self.unsubscribe(user_id, queue)
+
+    def close(self):
+        # ends every stream so shutdown doesn't wait on them
+        for queues in self.subscribers.values():
+            for queue in queues:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self.subscribers),
+            "connections": sum(len(queues) for queues in self.subscribers.values())
+        }
+
+hub = LiveHub()
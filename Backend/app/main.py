@@ -1,57 +1,88 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from . import crud, schemas
-from .models import Base
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from typing import List, Optional
+from datetime import date, datetime
+from . import crud, schemas, streaming, jobs, cache, migrations, instrumentation, columnar, analytics, derived, storage, passwords, tokens, export, etags, live
 from . import app
+from .database import settings, engine, all_engines, get_db, log_settings, logger
 
 # db setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./health_tracker.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
-
-# dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+migrations.upgrade(engine)
+for shard_engine in storage.backend.engines():
+    migrations.upgrade(shard_engine)
+
+# jobs open a session on the importing user's storage
+import_jobs = jobs.ImportJobManager(storage.backend.session)
+
+# per-request sql timing, Server-Timing headers and /metrics
+instrumentation.install(app, all_engines() + storage.backend.engines())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_settings()
+    storage.log_settings()
+    # imports publish from worker threads onto this loop
+    live.hub.start(asyncio.get_running_loop())
+    yield
+    live.hub.close()
+    import_jobs.shutdown()
+    passwords.hasher.shutdown()
+
+# the app itself is created in app/__init__.py, before the pools above exist
+app.router.lifespan_context = lifespan
 
+# register and login are async so the scrypt work waits on the password pool
+# instead of holding a threadpool worker; queries still go through run_in_threadpool
 @app.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    if crud.get_user_by_email(db, user.email):
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    if await run_in_threadpool(crud.get_user_by_email, db, user.email):
         raise HTTPException(status_code=400, detail="Email ya registrado")
-    if crud.get_user_by_username(db, user.username):
+    if await run_in_threadpool(crud.get_user_by_username, db, user.username):
         raise HTTPException(status_code=400, detail="Ya existe un usuario con ese nombre")
-    return crud.create_user(db, user)
+    password_hash = await passwords.hasher.hash_async(user.password)
+    return await run_in_threadpool(crud.create_user, db, user, storage.backend.user_data_session, password_hash)
 
 @app.post("/login")
-def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = crud.get_user_by_username(db, user_credentials.username)
-    if not user or not crud.verify_password(user_credentials.password, user.password):
+async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(crud.get_user_by_username, db, user_credentials.username)
+    valid, needs_rehash = await passwords.hasher.verify_async(
+        user_credentials.password, user.password if user else None
+    )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciales inválidas"
         )
-    return {"user_id": user.id}
+    if needs_rehash:
+        # legacy plaintext row (or an older cost setting): store a fresh hash
+        password_hash = await passwords.hasher.hash_async(user_credentials.password)
+        await run_in_threadpool(crud.update_password, db, user, password_hash)
+        await run_in_threadpool(storage.backend.replicate_user, user)
+    return {
+        "user_id": user.id,
+        "access_token": tokens.issue(user.id),
+        "token_type": "bearer",
+        "expires_in": tokens.TOKEN_TTL_SECONDS
+    }
 
 @app.post("/logout")
-def logout():
-    # placeholder
+def logout(claims: dict = Depends(tokens.require_token)):
+    tokens.revoked_tokens.revoke(claims["jti"], claims["exp"])
     return {"message": "Logged out successfully"}
 
-@app.get("/users/{user_id}", response_model=schemas.User)
+@app.get("/users/{user_id}", response_model=schemas.User, dependencies=[Depends(tokens.require_user)])
 def get_user(user_id: int, db: Session = Depends(get_db)):
     db_user = crud.get_user(db, user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return db_user
 
-@app.put("/users/{user_id}", response_model=dict)
+@app.put("/users/{user_id}", response_model=dict, dependencies=[Depends(tokens.require_user)])
 def update_user(
     user_id: int,
     user_update: schemas.UserUpdate,
@@ -85,9 +116,14 @@ def update_user(
     
     # handle password change if provided
     if user_update.new_password:
-        db_user.password = user_update.new_password
+        db_user.password = passwords.hasher.hash(user_update.new_password)
     
     db.commit()
+    # copies the profile to the user's shard when storage is sharded
+    with storage.backend.user_data_session(db, db_user) as data_db:
+        crud.bump_data_version(data_db, user_id)
+        data_db.commit()
+    cache.response_cache.invalidate_user(user_id)
     
     # let frontend know if they need to force re-login
     credentials_changed = (
@@ -100,70 +136,364 @@ def update_user(
         "credentials_changed": credentials_changed
     }
 
-@app.post("/users/{user_id}/import")
+async def _payload_fingerprint(request: Request) -> str:
+    # hash of the raw body, already read and cached by fastapi for the json parameter
+    return hashlib.sha256(await request.body()).hexdigest()
+
+@app.post("/users/{user_id}/import", dependencies=[Depends(tokens.require_user)])
 def import_data(
     user_id: int,
     import_data: schemas.ImportData,
-    db: Session = Depends(get_db)
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    fingerprint: str = Depends(_payload_fingerprint),
+    db: Session = Depends(storage.get_user_db)
 ):
-    user = crud.get_user(db, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
+    # a resent request (same Idempotency-Key, or same body with no writes since)
+    # gets the earlier response without touching the data
     try:
-        crud.import_user_data(
+        result = crud.find_import_result(db, user_id, idempotency_key, fingerprint)
+        if result is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return result
+        counts = crud.import_user_data(
             db=db,
             user_id=user_id,
             import_type=import_data.import_type,
             data=import_data.data
         )
-        return {"message": "Datos importados correctamente"}
+        result = {"message": "Datos importados correctamente", **counts}
+        crud.record_import_result(db, user_id, result, idempotency_key, fingerprint)
+        return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/dashboard/{user_id}/current", response_model=schemas.CurrentStats)
-def get_current_stats(user_id: int, db: Session = Depends(get_db)):
-    user = crud.get_user(db, user_id)
-    if not user:
+@app.post("/users/{user_id}/import/stream", dependencies=[Depends(tokens.require_user)])
+async def import_data_stream(
+    user_id: int,
+    import_type: str,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(storage.get_user_db)
+):
+    # body is NDJSON (one object per line) or CSV with the same columns as the frontend files
+    content_type = request.headers.get("content-type", "")
+    data_format = "csv" if content_type.startswith("text/csv") else "ndjson"
+
+    # the body is never held whole, so only an Idempotency-Key makes a replay
+    result = await run_in_threadpool(crud.find_import_result, db, user_id, idempotency_key)
+    if result is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+    try:
+        progress = await streaming.import_stream(
+            db=db,
+            user_id=user_id,
+            import_type=import_type,
+            chunks=request.stream(),
+            data_format=data_format
+        )
+        result = {"message": "Datos importados correctamente", **progress}
+        await run_in_threadpool(crud.record_import_result, db, user_id, result, idempotency_key)
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post(
+    "/users/{user_id}/import/jobs",
+    response_model=schemas.ImportJob,
+    status_code=202,
+    dependencies=[Depends(tokens.require_user)]
+)
+def submit_import_job(user_id: int, import_data: schemas.ImportData):
+    try:
+        return import_jobs.submit(user_id, import_data.import_type, import_data.data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get(
+    "/users/{user_id}/import/{job_id}",
+    response_model=schemas.ImportJob,
+    dependencies=[Depends(tokens.require_user)]
+)
+def get_import_job(user_id: int, job_id: str):
+    job = import_jobs.get(user_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+    return job
+
+@app.get("/users/{user_id}/export", dependencies=[Depends(tokens.require_user)])
+def export_data(
+    user_id: int,
+    data_format: str = Query("ndjson", alias="format"),
+    import_type: Optional[str] = None
+):
+    # full history of every metric (or just import_type) as ndjson, csv or a zip of csvs
+    if data_format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato de exportación inválido")
+    if import_type is not None and import_type not in crud.IMPORT_MODELS:
+        raise HTTPException(status_code=400, detail="Invalid import type")
+    if data_format == "csv" and import_type is None:
+        raise HTTPException(status_code=400, detail="La exportación en csv requiere import_type")
+
+    import_types = [import_type] if import_type else list(crud.IMPORT_MODELS)
+    filename = f"healthflow_{user_id}_{import_type or 'datos'}_{date.today().isoformat()}.{data_format}"
+    return StreamingResponse(
+        export.export_user_data(storage.backend.session, user_id, data_format, import_types),
+        media_type=export.EXPORT_FORMATS[data_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get(
+    "/dashboard/{user_id}/current",
+    response_model=schemas.CurrentStats,
+    dependencies=[Depends(tokens.require_user)]
+)
+def get_current_stats(
+    user_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(storage.get_user_read_db)
+):
+    # today's date is part of the keys so the totals roll over at midnight, and the cache
+    # keys carry the data version read before the query: a body computed by a read that
+    # overlapped an import is never stored under the version that followed it
+    generation = cache.response_cache.generation(user_id)
+    version = crud.get_data_version(db, user_id)
+    _, not_modified = etags.evaluate(
+        request, response, user_id, version, "current", date.today()
+    )
+    if not_modified:
+        return not_modified
+
+    cache_key = (user_id, "current", version, date.today())
+    stats = cache.response_cache.get(cache_key)
+    if stats is not None:
+        return stats
+
+    stats = crud.get_current_stats(db, user_id)
+    if stats is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    return crud.get_current_stats(db, user_id)
+    cache.response_cache.set(cache_key, stats, generation)
+    return stats
+
+def _live_snapshot(user_id: int):
+    # own short-lived session: the stream outlives the request
+    db = storage.backend.session(user_id, read_only=True)
+    try:
+        return crud.get_current_stats(db, user_id)
+    finally:
+        db.close()
 
-@app.get("/dashboard/{user_id}/history")
+@app.get("/dashboard/{user_id}/live", dependencies=[Depends(tokens.require_stream_user)])
+async def live_current_stats(user_id: int):
+    # Server-Sent Events: a "snapshot" event with the current stats, then a "delta"
+    # event with the changed fields after every import of this user
+    queue = live.hub.subscribe(user_id)
+    try:
+        stats = await run_in_threadpool(_live_snapshot, user_id)
+    except Exception:
+        live.hub.unsubscribe(user_id, queue)
+        raise
+    if stats is None:
+        live.hub.unsubscribe(user_id, queue)
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return StreamingResponse(
+        live.hub.stream(user_id, queue, live.hub.snapshot(user_id, queue, stats)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/dashboard/{user_id}/history/batch", dependencies=[Depends(tokens.require_user)])
+def get_history_batch(
+    user_id: int,
+    period: str,
+    request: Request,
+    response: Response,
+    metrics: List[str] = Query(...),
+    resolution: str = "raw",
+    max_points: Optional[int] = Query(None, ge=3),
+    db: Session = Depends(storage.get_user_read_db)
+):
+    # every chart of the dashboard in one call: cached series are reused, the rest
+    # come from a single UNION ALL
+    metrics = list(dict.fromkeys(metrics))
+    # the windows move with the date, so it's part of the etag
+    generation = cache.response_cache.generation(user_id)
+    version = crud.get_data_version(db, user_id)
+    _, not_modified = etags.evaluate(
+        request, response, user_id, version,
+        "batch", tuple(metrics), period, resolution, max_points, date.today()
+    )
+    if not_modified:
+        return not_modified
+
+    result = {}
+    for metric in metrics:
+        cached = cache.response_cache.get((user_id, "history", version, metric, period, resolution, max_points))
+        if cached is not None:
+            result[metric] = cached
+
+    missing = [metric for metric in metrics if metric not in result]
+    if missing:
+        if period not in crud.HISTORY_PERIODS:
+            raise HTTPException(status_code=400, detail="Período inválido")
+
+        start_date = datetime.now() - crud.HISTORY_PERIODS[period]
+
+        try:
+            fetched = crud.get_metric_history_batch(db, user_id, missing, start_date, resolution, max_points)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for metric, series in fetched.items():
+            cache.response_cache.set((user_id, "history", version, metric, period, resolution, max_points), series, generation)
+            result[metric] = series
+
+    return {metric: result[metric] for metric in metrics}
+
+@app.get("/dashboard/{user_id}/history", dependencies=[Depends(tokens.require_user)])
 def get_history(
     user_id: int,
     metric: str,
     period: str,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    resolution: str = "raw",
+    max_points: Optional[int] = Query(None, ge=3),
+    db: Session = Depends(storage.get_user_read_db)
 ):
-    user = crud.get_user(db, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
+    # resolution buckets the series server side (day/week/month),
+    # max_points caps its length with LTTB downsampling, and a columnar
+    # Accept type skips the per-row dicts entirely
+    columnar_type = columnar.negotiate(request.headers.get("accept"))
+    generation = cache.response_cache.generation(user_id)
+    version = crud.get_data_version(db, user_id)
+    etag, not_modified = etags.evaluate(
+        request, response, user_id, version,
+        "history", columnar_type, metric, period, resolution, max_points, date.today(),
+        vary="Accept"
+    )
+    if not_modified:
+        return not_modified
+
+    cache_key = (user_id, "columns" if columnar_type else "history", version, metric, period, resolution, max_points)
+    cached = cache.response_cache.get(cache_key)
+    if cached is not None:
+        if columnar_type:
+            return etags.set_headers(columnar.response(cached, columnar_type), etag, "Accept")
+        return cached
+
     # calculate start date based on period
-    end_date = datetime.now()
-    period_map = {
-        "1w": timedelta(weeks=1),
-        "1m": timedelta(days=30),
-        "3m": timedelta(days=90),
-        "6m": timedelta(days=180),
-        "1y": timedelta(days=365)
-    }
-    
-    if period not in period_map:
+    if period not in crud.HISTORY_PERIODS:
         raise HTTPException(status_code=400, detail="Período inválido")
     
-    start_date = end_date - period_map[period]
+    start_date = datetime.now() - crud.HISTORY_PERIODS[period]
     
     try:
-        result = crud.get_metric_history(db, user_id, metric, start_date)
-        
-        # For cumulative metrics, return total as well
-        if metric in ["water", "steps", "exercise"]:
-            return {
-                "data": result["data"],
-                "total": result["total"]
-            }
+        if columnar_type:
+            columns = crud.get_metric_history_columns(db, user_id, metric, start_date, resolution, max_points)
+            cache.response_cache.set(cache_key, columns, generation)
+            return etags.set_headers(columnar.response(columns, columnar_type), etag, "Accept")
+
+        result = crud.get_metric_history(db, user_id, metric, start_date, resolution, max_points)
+        cache.response_cache.set(cache_key, result, generation)
         return result
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/dashboard/{user_id}/derived", dependencies=[Depends(tokens.require_user)])
+def get_derived(
+    user_id: int,
+    metric: str,
+    period: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(storage.get_user_read_db)
+):
+    # bmi over time, 7-day moving averages and trend lines, read from the
+    # precomputed daily_metrics table instead of the raw rows
+    generation = cache.response_cache.generation(user_id)
+    version = crud.get_data_version(db, user_id)
+    _, not_modified = etags.evaluate(
+        request, response, user_id, version,
+        "derived", metric, period, date.today()
+    )
+    if not_modified:
+        return not_modified
+
+    cache_key = (user_id, "derived", version, metric, period)
+    cached = cache.response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if period not in crud.HISTORY_PERIODS:
+        raise HTTPException(status_code=400, detail="Período inválido")
+
+    start_day = (datetime.now() - crud.HISTORY_PERIODS[period]).date()
+
+    try:
+        result = derived.get_derived_series(db, user_id, metric, start_day)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cache.response_cache.set(cache_key, result, generation)
+    return result
+
+# cohort analytics, optionally filtered by gender and age range; staff only
+@app.get("/analytics/bmi", dependencies=[Depends(tokens.require_staff)])
+def get_bmi_distribution(
+    gender: Optional[str] = None,
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    dbs: List[Session] = Depends(storage.get_all_read_dbs)
+):
+    return analytics.bmi_distribution(dbs, gender=gender, min_age=min_age, max_age=max_age)
+
+@app.get("/analytics/steps/weekly", dependencies=[Depends(tokens.require_staff)])
+def get_weekly_steps(
+    period: str = "3m",
+    gender: Optional[str] = None,
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    dbs: List[Session] = Depends(storage.get_all_read_dbs)
+):
+    if period not in crud.HISTORY_PERIODS:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    start = (datetime.now() - crud.HISTORY_PERIODS[period]).date()
+    return analytics.weekly_step_percentiles(dbs, start, gender=gender, min_age=min_age, max_age=max_age)
+
+@app.get("/analytics/water/trend", dependencies=[Depends(tokens.require_staff)])
+def get_water_trend(
+    period: str = "3m",
+    gender: Optional[str] = None,
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    dbs: List[Session] = Depends(storage.get_all_read_dbs)
+):
+    if period not in crud.HISTORY_PERIODS:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    start = (datetime.now() - crud.HISTORY_PERIODS[period]).date()
+    return analytics.water_intake_trend(dbs, start, gender=gender, min_age=min_age, max_age=max_age)
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return cache.response_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    extra_lines = [
+        f"healthflow_cache_{name} {value}"
+        for name, value in cache.response_cache.stats().items()
+    ] + [
+        f"healthflow_live_{name} {value}"
+        for name, value in live.hub.stats().items()
+    ]
+    return instrumentation.metrics.render(extra_lines)
+
+if settings.async_db and storage.backend.sharded:
+    # the async stack only knows the main database
+    logger.warning("HEALTHFLOW_DB_ASYNC ignorado: no es compatible con HEALTHFLOW_DB_SHARDS")
+elif settings.async_db:
+    from . import async_api
+    async_api.install(app)
@@ -0,0 +1,74 @@
+from collections import namedtuple
+from . import models, schemas
+
+# every metric the app knows about, in one place. imports, the current stats snapshot,
+# history, rollups and derived series are all built from this table, so a new metric
+# is one entry here (plus its model and import schema).
+#
+# kind: point metrics are measurements (latest value, averaged per bucket); cumulative
+# ones add up over the day (daily_totals rollups, summed per bucket)
+# import_type: the import that writes the model; metrics sharing a table share it
+# history: served by /history and kept as a derived series
+# current: label in the current stats snapshot, None to leave it out
+POINT = "point"
+CUMULATIVE = "cumulative"
+
+Metric = namedtuple("Metric", ["model", "column", "kind", "import_type", "schema", "history", "current"])
+
+METRICS = {
+    "weight": Metric(models.Weight, models.Weight.weight, POINT, "weight", schemas.WeightBase, True, "weight"),
+    "height": Metric(models.Height, models.Height.height, POINT, "height", schemas.HeightBase, False, "height"),
+    "fat": Metric(
+        models.BodyComposition, models.BodyComposition.fat, POINT,
+        "body_composition", schemas.BodyCompositionBase, False, "fat"
+    ),
+    "muscle": Metric(
+        models.BodyComposition, models.BodyComposition.muscle, POINT,
+        "body_composition", schemas.BodyCompositionBase, True, "muscle"
+    ),
+    "body_water": Metric(
+        models.BodyComposition, models.BodyComposition.water, POINT,
+        "body_composition", schemas.BodyCompositionBase, False, "body_water"
+    ),
+    "water": Metric(
+        models.WaterConsumption, models.WaterConsumption.water_amount, CUMULATIVE,
+        "water", schemas.WaterConsumptionBase, True, "water_consumed"
+    ),
+    "steps": Metric(
+        models.DailySteps, models.DailySteps.steps_amount, CUMULATIVE,
+        "steps", schemas.DailyStepsBase, True, "steps"
+    ),
+    # today's exercises are listed by name in the snapshot instead of summed
+    "exercise": Metric(models.Exercise, models.Exercise.duration, CUMULATIVE, "exercise", schemas.ExerciseBase, True, None),
+    "fat_percentage": Metric(
+        models.BodyFatPercentage, models.BodyFatPercentage.fat_percentage, POINT,
+        "body_fat", schemas.BodyFatPercentageBase, True, "fat_percentage"
+    )
+}
+
+# lookups derived from the registry
+IMPORT_MODELS = {}
+IMPORT_METRICS = {}
+for _name, _metric in METRICS.items():
+    IMPORT_MODELS.setdefault(_metric.import_type, (_metric.model, _metric.schema))
+    IMPORT_METRICS.setdefault(_metric.import_type, []).append(_name)
+
+# one entry per table, in registry order
+METRIC_MODELS = list(dict.fromkeys(metric.model for metric in METRICS.values()))
+
+HISTORY_METRICS = tuple(name for name, metric in METRICS.items() if metric.history)
+
+POINT_METRICS = {
+    name: (metric.model, metric.column)
+    for name, metric in METRICS.items() if metric.history and metric.kind == POINT
+}
+
+CUMULATIVE_METRICS = {
+    name: (metric.model, metric.column)
+    for name, metric in METRICS.items() if metric.kind == CUMULATIVE
+}
+
+CURRENT_METRICS = [metric for metric in METRICS.values() if metric.current]
+
+def is_cumulative(name: str) -> bool:
+    return name in CUMULATIVE_METRICS
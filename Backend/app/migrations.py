@@ -0,0 +1,82 @@
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from . import metrics
+from .models import Base
+
+METRIC_MODELS = metrics.METRIC_MODELS
+
+def upgrade(engine: Engine):
+    # create_all only creates missing tables, so indexes added to existing
+    # tables (e.g. on an old health_tracker.db) have to be created here
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # a connection that inspected the tables before an index was added can keep
+    # planning without it; the app's queries get fresh connections
+    engine.dispose()
+
+def add_missing_columns(engine: Engine):
+    # same for columns added to existing tables (users.data_version); sqlite can
+    # only ADD COLUMN, so new columns need to be nullable or have a server default
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+
+def explain(engine: Engine, stmt):
+    compiled = stmt.compile(dialect=engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).all()
+    return " | ".join(row[-1] for row in rows)
+
+def check_query_plans(engine: Engine):
+    # the dashboard queries must be index seeks on (user_id, date), never table scans
+    day_start = datetime.combine(datetime.now().date(), datetime.min.time())
+    failures = []
+    for model in METRIC_MODELS:
+        index_name = f"ix_{model.__tablename__}_user_id_date"
+        statements = {
+            "latest": select(model).where(model.user_id == 1).order_by(model.date.desc()).limit(1),
+            "range": select(model).where(
+                model.user_id == 1,
+                model.date >= day_start,
+                model.date < day_start + timedelta(days=1)
+            )
+        }
+        for name, stmt in statements.items():
+            plan = explain(engine, stmt)
+            if f"USING INDEX {index_name}" not in plan and f"USING COVERING INDEX {index_name}" not in plan:
+                failures.append(f"{model.__tablename__} {name}: {plan}")
+    return failures
+
+if __name__ == "__main__":
+    # python -m app.migrations upgrade|check
+    parser = argparse.ArgumentParser(description="Migraciones de la base de datos")
+    parser.add_argument("command", choices=["upgrade", "check"])
+    args = parser.parse_args()
+
+    from .database import engine
+    from .storage import backend
+    if args.command == "upgrade":
+        upgrade(engine)
+        for shard_engine in backend.engines():
+            upgrade(shard_engine)
+    else:
+        failures = [
+            failure
+            for checked_engine in [engine] + backend.engines()
+            for failure in check_query_plans(checked_engine)
+        ]
+        for failure in failures:
+            print(failure)
+        raise SystemExit(1 if failures else 0)
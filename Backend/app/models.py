@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -11,6 +11,8 @@ class User(Base):
     password = Column(String)
     birthday = Column(DateTime)
     gender = Column(String)
+    # bumped on every write to the user's data; dashboard ETags are derived from it
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # relationships
     weights = relationship("Weight", back_populates="user")
@@ -23,6 +25,9 @@ class User(Base):
 
 class Weight(Base):
     __tablename__ = "weights"
+    # every metric table gets a (user_id, date) index: queries filter on user first, then a
+    # date range, and the (date, user_id) primary key can't serve that
+    __table_args__ = (Index("ix_weights_user_id_date", "user_id", "date"),)
     date = Column(DateTime, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     weight = Column(Float)
@@ -30,6 +35,7 @@ class Weight(Base):
 
 class Height(Base):
     __tablename__ = "heights"
+    __table_args__ = (Index("ix_heights_user_id_date", "user_id", "date"),)
     date = Column(DateTime, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     height = Column(Float)
@@ -37,6 +43,7 @@ class Height(Base):
 
 class BodyComposition(Base):
     __tablename__ = "body_compositions"
+    __table_args__ = (Index("ix_body_compositions_user_id_date", "user_id", "date"),)
     date = Column(DateTime, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     fat = Column(Float)
@@ -46,6 +53,7 @@ class BodyComposition(Base):
 
 class WaterConsumption(Base):
     __tablename__ = "water_consumptions"
+    __table_args__ = (Index("ix_water_consumptions_user_id_date", "user_id", "date"),)
     date = Column(DateTime, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     water_amount = Column(Integer)  # in glasses (250ml each)
@@ -53,6 +61,7 @@ class WaterConsumption(Base):
 
 class DailySteps(Base):
     __tablename__ = "daily_steps"
+    __table_args__ = (Index("ix_daily_steps_user_id_date", "user_id", "date"),)
     date = Column(DateTime, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     steps_amount = Column(Integer)
@@ -60,6 +69,7 @@ class DailySteps(Base):
 
 class Exercise(Base):
     __tablename__ = "exercises"
+    __table_args__ = (Index("ix_exercises_user_id_date", "user_id", "date"),)
     date = Column(DateTime, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     exercise_name = Column(String)
@@ -68,7 +78,45 @@ class Exercise(Base):
 
 class BodyFatPercentage(Base):
     __tablename__ = "body_fat_percentages"
+    __table_args__ = (Index("ix_body_fat_percentages_user_id_date", "user_id", "date"),)
     date = Column(DateTime, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     fat_percentage = Column(Float)
-    user = relationship("User", back_populates="body_fat_percentages")
\ No newline at end of file
+    user = relationship("User", back_populates="body_fat_percentages")
+
+# daily rollups of the cumulative metrics (water, steps, exercise), kept up to date on import
+class DailyTotal(Base):
+    __tablename__ = "daily_totals"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    metric = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    total = Column(Float)
+    entries = Column(Integer)
+
+# per-day derived series (daily value, bmi, 7-day moving average), kept up to date on import
+class DailyMetric(Base):
+    __tablename__ = "daily_metrics"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    metric = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    value = Column(Float)
+    avg_7d = Column(Float)
+
+# months of raw rows moved out of the live tables into archive files (app/archive.py)
+class ArchivedMonth(Base):
+    __tablename__ = "archived_months"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    import_type = Column(String, primary_key=True)
+    month = Column(Date, primary_key=True)
+    rows = Column(Integer)
+
+# results of finished imports, replayed for a resent request (crud.find_import_result);
+# key is the client's Idempotency-Key or the hash of the payload
+class ImportRequest(Base):
+    __tablename__ = "import_requests"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String)
+    data_version = Column(Integer)
+    result = Column(String)
+    created_at = Column(DateTime)
@@ -0,0 +1,82 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# scrypt from the standard library, cost tunable through the environment. hashlib
+# releases the GIL while hashing, so a thread pool gives real parallelism; the pool
+# is bounded and separate from the request threadpool, so a login storm queues here
+# instead of taking every worker thread
+SCRYPT_N = int(os.getenv("HEALTHFLOW_SCRYPT_N", "16384"))
+SCRYPT_R = int(os.getenv("HEALTHFLOW_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("HEALTHFLOW_SCRYPT_P", "1"))
+HASH_WORKERS = int(os.getenv("HEALTHFLOW_PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+PREFIX = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem above openssl's 32MB default so larger n values work
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+class PasswordHasher:
+    def __init__(self, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P, max_workers: int = HASH_WORKERS):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._dummy_hash = None
+
+    # stored format: scrypt$n$r$p$salt$key
+    def _hash(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        key = _scrypt(password, salt, self.n, self.r, self.p)
+        return "$".join([PREFIX, str(self.n), str(self.r), str(self.p), _b64(salt), _b64(key)])
+
+    def _verify(self, password: str, stored: str):
+        # returns (valid, needs_rehash). stored=None (unknown username) still pays
+        # for a full hash, so it takes as long as a wrong password
+        if stored is None:
+            self._verify(password, self._dummy())
+            return False, False
+        parts = stored.split("$")
+        if len(parts) != 6 or parts[0] != PREFIX:
+            # legacy plaintext row
+            valid = hmac.compare_digest(password.encode(), stored.encode())
+            return valid, valid
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        key = _scrypt(password, base64.b64decode(parts[4]), n, r, p)
+        valid = hmac.compare_digest(key, base64.b64decode(parts[5]))
+        return valid, valid and (n, r, p) != (self.n, self.r, self.p)
+
+    def _dummy(self) -> str:
+        if self._dummy_hash is None:
+            self._dummy_hash = self._hash(_b64(os.urandom(SALT_BYTES)))
+        return self._dummy_hash
+
+    # sync callers block on the pool, async ones await it
+    def hash(self, password: str) -> str:
+        return self.executor.submit(self._hash, password).result()
+
+    def verify(self, password: str, stored: str):
+        return self.executor.submit(self._verify, password, stored).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._hash, password)
+
+    async def verify_async(self, password: str, stored: str):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._verify, password, stored)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+hasher = PasswordHasher()
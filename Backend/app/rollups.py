@@ -0,0 +1,72 @@
+import argparse
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, select, update, literal
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import models, metrics
+
+# cumulative metrics served from daily_totals instead of re-aggregating raw rows
+ROLLUP_METRICS = metrics.CUMULATIVE_METRICS
+
+def _rollup_insert(metric: str, *filters):
+    model, column = ROLLUP_METRICS[metric]
+    day = func.date(model.date)
+    totals = select(
+        model.user_id,
+        literal(metric),
+        day,
+        func.sum(column),
+        func.count()
+    ).where(*filters).group_by(model.user_id, day)
+
+    stmt = sqlite_insert(models.DailyTotal).from_select(
+        ["user_id", "metric", "day", "total", "entries"], totals
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "metric", "day"],
+        set_={"total": stmt.excluded.total, "entries": stmt.excluded.entries}
+    )
+
+def refresh_daily_totals(db: Session, user_id: int, metric: str, first_day: date, last_day: date):
+    # recompute the rollup rows for [first_day, last_day] from the raw table
+    model, _ = ROLLUP_METRICS[metric]
+    db.execute(_rollup_insert(
+        metric,
+        model.user_id == user_id,
+        model.date >= datetime.combine(first_day, time.min),
+        model.date < datetime.combine(last_day + timedelta(days=1), time.min)
+    ))
+
+def backfill_daily_totals(db: Session):
+    # rebuild every rollup from scratch, for databases created before daily_totals existed
+    for metric in ROLLUP_METRICS:
+        db.query(models.DailyTotal).filter(models.DailyTotal.metric == metric).delete()
+        db.execute(_rollup_insert(metric, literal(True)))
+    # served history may change, so cached ETags have to go
+    db.execute(update(models.User).values(data_version=models.User.data_version + 1))
+    db.commit()
+
+if __name__ == "__main__":
+    # python -m app.rollups backfill
+    parser = argparse.ArgumentParser(description="Mantenimiento de los totales diarios")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+
+    from .database import engine
+    from .migrations import upgrade
+    from .storage import backend
+    from .archive import has_archives
+    upgrade(engine)
+    for shard_engine in backend.engines():
+        upgrade(shard_engine)
+    # the backfill rebuilds from the live tables only
+    for session_factory in backend.sessionmakers():
+        with session_factory() as db:
+            if has_archives(db):
+                parser.error("hay meses archivados; restaurarlos antes con: python -m app.archive restore --all")
+    for session_factory in backend.sessionmakers():
+        db = session_factory()
+        try:
+            backfill_daily_totals(db)
+        finally:
+            db.close()
@@ -75,6 +75,21 @@ class ImportData(BaseModel):
     import_type: str
     data: List[dict]
 
+# for background import jobs
+class ImportJob(BaseModel):
+    job_id: str
+    import_type: str
+    status: str  # queued, running, completed, failed
+    total: int
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejected: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 # for dashboard response
 class CurrentStats(BaseModel):
     weight: Optional[float] = None
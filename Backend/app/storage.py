@@ -0,0 +1,198 @@
+import argparse
+import os
+import zlib
+from contextlib import contextmanager
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import models, metrics
+from .database import settings, engine, SessionLocal, ReadSessionLocal, make_engine, logger
+
+# with HEALTHFLOW_DB_SHARDS > 1 every user's measurements live in one of several sqlite
+# files picked by a hash of the user id, so imports for different users don't queue on
+# a single writer lock. the main database stays the directory: it owns the users table
+# (ids, unique email/username, login) and each shard keeps a copy of its users' rows
+SHARD_COUNT = int(os.getenv("HEALTHFLOW_DB_SHARDS", "0"))
+SHARD_URL = os.getenv("HEALTHFLOW_DB_SHARD_URL", "sqlite:///./health_tracker_shard{shard}.db")
+
+# per-user tables, users first so a shard has the user row before its measurements
+USER_TABLES = [models.User.__table__] + [model.__table__ for model in metrics.METRIC_MODELS] + [
+    models.DailyTotal.__table__,
+    models.DailyMetric.__table__,
+    models.ArchivedMonth.__table__,
+    models.ImportRequest.__table__
+]
+
+# rows per INSERT when moving users between files
+COPY_BATCH_SIZE = 500
+
+def shard_for(user_id: int, count: int) -> int:
+    # crc32 rather than hash(): stable across processes and python versions
+    return zlib.crc32(str(user_id).encode()) % count
+
+def _user_column(table):
+    return table.c.id if table is models.User.__table__ else table.c.user_id
+
+def _user_row(user) -> dict:
+    return {column.name: getattr(user, column.name) for column in models.User.__table__.columns}
+
+class SingleFileStorage:
+    sharded = False
+
+    def session(self, user_id: int, read_only: bool = False) -> Session:
+        return (ReadSessionLocal if read_only else SessionLocal)()
+
+    def sessionmakers(self, read_only: bool = False):
+        return [ReadSessionLocal if read_only else SessionLocal]
+
+    def engines(self):
+        # the main engines are already covered by database.all_engines
+        return []
+
+    def replicate_user(self, user):
+        pass
+
+    @contextmanager
+    def user_data_session(self, db: Session, user):
+        yield db
+
+class ShardedStorage:
+    sharded = True
+
+    def __init__(self, count: int, url_template: str):
+        self.count = count
+        self.urls = [url_template.format(shard=shard) for shard in range(count)]
+        # one engine and pool per file; shards have no separate read pool
+        self.shard_engines = [make_engine(settings.pool_size, url=url) for url in self.urls]
+        self.shard_sessions = [
+            sessionmaker(autocommit=False, autoflush=False, bind=shard_engine)
+            for shard_engine in self.shard_engines
+        ]
+
+    def session(self, user_id: int, read_only: bool = False) -> Session:
+        return self.shard_sessions[shard_for(user_id, self.count)]()
+
+    def sessionmakers(self, read_only: bool = False):
+        return list(self.shard_sessions)
+
+    def engines(self):
+        return list(self.shard_engines)
+
+    def replicate_user(self, user):
+        # per-user statements (current stats selects from users) then never span files
+        # data_version is left alone on update: it's bumped by writes on the shard itself
+        row = _user_row(user)
+        stmt = sqlite_insert(models.User).values(row)
+        profile = {key: value for key, value in row.items() if key != "data_version"}
+        with self.session(user.id) as db:
+            db.execute(stmt.on_conflict_do_update(index_elements=["id"], set_=profile))
+            db.commit()
+
+    @contextmanager
+    def user_data_session(self, db: Session, user):
+        self.replicate_user(user)
+        data_db = self.session(user.id)
+        try:
+            yield data_db
+        finally:
+            data_db.close()
+
+backend = ShardedStorage(SHARD_COUNT, SHARD_URL) if SHARD_COUNT > 1 else SingleFileStorage()
+
+def log_settings():
+    if backend.sharded:
+        logger.info("Storage: %d shards, %s", backend.count, SHARD_URL)
+
+# dependencies, user_id comes from the path
+def get_user_db(user_id: int):
+    db = backend.session(user_id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_user_read_db(user_id: int):
+    db = backend.session(user_id, read_only=True)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_all_read_dbs():
+    # cross-user queries (analytics) run once per shard
+    dbs = [factory() for factory in backend.sessionmakers(read_only=True)]
+    try:
+        yield dbs
+    finally:
+        for db in dbs:
+            db.close()
+
+# migration and rebalancing, run with the server stopped
+def copy_user(source, target, user_id: int, tables=USER_TABLES):
+    # INSERT OR REPLACE, so rerunning after an interrupted move is harmless
+    for table in tables:
+        rows = source.execute(select(table).where(_user_column(table) == user_id)).mappings().all()
+        for start in range(0, len(rows), COPY_BATCH_SIZE):
+            target.execute(sqlite_insert(table).prefix_with("OR REPLACE").values(
+                [dict(row) for row in rows[start:start + COPY_BATCH_SIZE]]
+            ))
+
+def delete_user(conn, user_id: int, tables=USER_TABLES):
+    for table in reversed(tables):
+        conn.execute(delete(table).where(_user_column(table) == user_id))
+
+def migrate_single_file(prune: bool = True):
+    # split the main database into the configured shards; users stay in the main
+    # file as the directory, their measurements are copied out (and pruned)
+    moved = 0
+    with engine.connect() as conn:
+        user_ids = conn.execute(select(models.User.id)).scalars().all()
+    for user_id in user_ids:
+        with engine.begin() as source, backend.shard_engines[shard_for(user_id, backend.count)].begin() as target:
+            copy_user(source, target, user_id)
+            if prune:
+                delete_user(source, user_id, USER_TABLES[1:])
+        moved += 1
+    return moved
+
+def rebalance(old_count: int):
+    # move users whose shard changed between old_count and the current shard count
+    urls = [SHARD_URL.format(shard=shard) for shard in range(max(old_count, backend.count))]
+    engines = backend.engines() + [make_engine(settings.pool_size, url=url) for url in urls[backend.count:]]
+    moved = 0
+    for shard in range(old_count):
+        with engines[shard].connect() as conn:
+            user_ids = conn.execute(select(models.User.id)).scalars().all()
+        for user_id in user_ids:
+            target_shard = shard_for(user_id, backend.count)
+            if target_shard == shard:
+                continue
+            with engines[shard].begin() as source, engines[target_shard].begin() as target:
+                copy_user(source, target, user_id)
+                delete_user(source, user_id)
+            moved += 1
+    return moved
+
+if __name__ == "__main__":
+    # python -m app.storage migrate | rebalance --from N
+    parser = argparse.ArgumentParser(description="Particionado de la base de datos por usuario")
+    parser.add_argument("command", choices=["migrate", "rebalance"])
+    parser.add_argument("--from", dest="old_count", type=int, help="cantidad de shards anterior (rebalance)")
+    parser.add_argument("--keep-source", action="store_true", help="no borrar las mediciones de la base principal (migrate)")
+    args = parser.parse_args()
+
+    if not backend.sharded:
+        parser.error("HEALTHFLOW_DB_SHARDS debe ser mayor que 1")
+
+    from .migrations import upgrade
+    upgrade(engine)
+    for shard_engine in backend.engines():
+        upgrade(shard_engine)
+
+    if args.command == "migrate":
+        moved = migrate_single_file(prune=not args.keep_source)
+    else:
+        if not args.old_count:
+            parser.error("rebalance requiere --from")
+        moved = rebalance(args.old_count)
+    print(f"{moved} usuarios movidos")
@@ -0,0 +1,81 @@
+import csv
+import json
+from typing import AsyncIterator
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from . import crud
+
+# streaming import: rows are parsed as the body arrives and written batch by batch,
+# so memory stays at one batch no matter how large the upload is
+
+async def iter_lines(chunks: AsyncIterator[bytes]):
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]):
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # unparseable lines still reach validation so they count as rejected
+            yield None
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes], fields: list):
+    # columns are positional (fecha,peso,...), same as the csv files the frontend imports
+    header_skipped = False
+    async for line in iter_lines(chunks):
+        text = line.decode("utf-8-sig").strip()
+        if not text:
+            continue
+        if not header_skipped:
+            header_skipped = True
+            continue
+        values = next(csv.reader([text]))
+        yield dict(zip(fields, values)) if len(values) == len(fields) else None
+
+def iter_rows(chunks: AsyncIterator[bytes], import_type: str, data_format: str):
+    if import_type not in crud.IMPORT_MODELS:
+        raise ValueError("Invalid import type")
+    if data_format == "ndjson":
+        return iter_ndjson_rows(chunks)
+    if data_format == "csv":
+        _, schema = crud.IMPORT_MODELS[import_type]
+        return iter_csv_rows(chunks, list(schema.model_fields))
+    raise ValueError("Invalid import format")
+
+async def import_stream(
+    db: Session,
+    user_id: int,
+    import_type: str,
+    chunks: AsyncIterator[bytes],
+    data_format: str
+):
+    rows = iter_rows(chunks, import_type, data_format)
+    progress = {"batches": 0, "inserted": 0, "updated": 0, "unchanged": 0, "rejected": 0}
+
+    async def flush(batch):
+        counts = await run_in_threadpool(crud.import_user_data, db, user_id, import_type, batch)
+        progress["batches"] += 1
+        for key, value in counts.items():
+            progress[key] += value
+
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= crud.IMPORT_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+
+    if batch:
+        await flush(batch)
+
+    return progress
@@ -0,0 +1,117 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+
+# stateless HS256 JWTs issued by /login. a valid token proves the user existed when
+# it was issued, so the per-user endpoints check it instead of querying users.
+# without HEALTHFLOW_TOKEN_SECRET a random secret is used: tokens then don't survive
+# a restart and aren't shared between uvicorn workers
+SECRET = (os.getenv("HEALTHFLOW_TOKEN_SECRET") or secrets.token_hex(32)).encode()
+TOKEN_TTL_SECONDS = int(os.getenv("HEALTHFLOW_TOKEN_TTL_SECONDS", str(12 * 3600)))
+# users allowed on the cohort analytics (population data), e.g. "1,7"
+STAFF_USER_IDS = {int(user_id) for user_id in os.getenv("HEALTHFLOW_STAFF_USER_IDS", "").split(",") if user_id.strip()}
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+def _sign(signing_input: str) -> str:
+    return _b64encode(hmac.new(SECRET, signing_input.encode("ascii"), hashlib.sha256).digest())
+
+def issue(user_id: int) -> str:
+    now = int(time.time())
+    claims = {"sub": str(user_id), "iat": now, "exp": now + TOKEN_TTL_SECONDS, "jti": secrets.token_hex(8)}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    signing_input = f"{HEADER}.{payload}"
+    return f"{signing_input}.{_sign(signing_input)}"
+
+def decode(token: str) -> Optional[Dict[str, Any]]:
+    # claims of a well-signed, unexpired token, None otherwise
+    try:
+        header, payload, signature = token.split(".")
+    except ValueError:
+        return None
+    if header != HEADER or not hmac.compare_digest(signature, _sign(f"{header}.{payload}")):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) <= time.time():
+        return None
+    return claims
+
+class RevocationList:
+    # jti -> exp of logged out tokens; entries are dropped once the token would
+    # have expired anyway, so the set stays as small as the logouts within one TTL.
+    # per process, like the response cache
+    def __init__(self, purge_interval: float = 60.0):
+        self.revoked = {}
+        self.lock = threading.Lock()
+        self.purge_interval = purge_interval
+        self.next_purge = time.time() + purge_interval
+
+    def revoke(self, jti: str, expires_at: float):
+        with self.lock:
+            self.revoked[jti] = expires_at
+            now = time.time()
+            if now >= self.next_purge:
+                self.revoked = {key: exp for key, exp in self.revoked.items() if exp > now}
+                self.next_purge = now + self.purge_interval
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self.revoked
+
+    def __len__(self):
+        return len(self.revoked)
+
+revoked_tokens = RevocationList()
+
+bearer = HTTPBearer(auto_error=False)
+
+def _valid_claims(token: Optional[str]) -> Dict[str, Any]:
+    claims = decode(token) if token else None
+    if claims is None or revoked_tokens.is_revoked(claims["jti"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesión inválida o expirada",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return claims
+
+# dependencies
+def require_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Dict[str, Any]:
+    return _valid_claims(credentials.credentials if credentials else None)
+
+def require_user(user_id: int, claims: Dict[str, Any] = Depends(require_token)) -> int:
+    # user_id comes from the path and has to be the token's subject
+    if claims["sub"] != str(user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
+    return user_id
+
+def require_staff(claims: Dict[str, Any] = Depends(require_token)) -> int:
+    user_id = int(claims["sub"])
+    if user_id not in STAFF_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado")
+    return user_id
+
+def require_stream_user(
+    user_id: int,
+    access_token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)
+) -> int:
+    # EventSource can't send headers, so streams also take the token as ?access_token=
+    claims = _valid_claims(credentials.credentials if credentials else access_token)
+    return require_user(user_id, claims)
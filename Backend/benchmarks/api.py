@@ -0,0 +1,206 @@
+# load test for the HealthFlow API: populates a fresh database with synthetic users and
+# drives the main endpoints, either in process (TestClient) or against a local uvicorn
+#
+#   cd backend
+#   python -m benchmarks.api --users 20 --days 90 --requests 200 --mode testclient
+#   python -m benchmarks.api --mode uvicorn --concurrency 8 --output results/bench.json
+#   python -m benchmarks.compare results/old.json results/new.json
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SCENARIOS = ["register", "login", "import", "current", "history"]
+
+HISTORY_METRICS = ["weight", "muscle", "fat_percentage", "water", "steps", "exercise"]
+
+def authenticate(client, accounts):
+    # (user_id, username, password) -> (user_id, username, password, auth headers)
+    authenticated = []
+    for user_id, username, password in accounts:
+        token = client.post("/login", json={"username": username, "password": password}).json()["access_token"]
+        authenticated.append((user_id, username, password, {"Authorization": f"Bearer {token}"}))
+    return authenticated
+
+def make_request(client, scenario, accounts, i, rng):
+    user_id, username, password, headers = rng.choice(accounts)
+    if scenario == "register":
+        return client.post("/register", json={
+            "email": f"load{i}-{rng.random()}@example.com",
+            "username": f"load{i}-{rng.random()}",
+            "password": "Benchmark#2024",
+            "birthday": "1990-01-01T00:00:00",
+            "gender": "Femenino",
+            "current_weight": 70,
+            "current_height": 170
+        })
+    if scenario == "login":
+        return client.post("/login", json={"username": username, "password": password})
+    if scenario == "import":
+        day = datetime.now() - timedelta(days=rng.randint(0, 30))
+        return client.post(f"/users/{user_id}/import", headers=headers, json={
+            "import_type": "steps",
+            "data": [
+                {"date": (day + timedelta(minutes=m)).isoformat(), "steps_amount": rng.randint(0, 200)}
+                for m in range(0, 24 * 60, 5)
+            ]
+        })
+    if scenario == "current":
+        return client.get(f"/dashboard/{user_id}/current", headers=headers)
+    return client.get(f"/dashboard/{user_id}/history", headers=headers, params={
+        "metric": rng.choice(HISTORY_METRICS),
+        "period": rng.choice(["1w", "1m", "3m", "6m", "1y"])
+    })
+
+def summarize(timings, elapsed, statements):
+    quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+    return {
+        "requests": len(timings),
+        "rps": round(len(timings) / elapsed, 1),
+        "p50_ms": round(quantiles[49], 3),
+        "p95_ms": round(quantiles[94], 3),
+        "p99_ms": round(quantiles[98], 3),
+        "statements_per_request": round(statements / len(timings), 2) if statements is not None else None
+    }
+
+def run_scenario(client, scenario, accounts, requests, concurrency, counter=None):
+    rng = random.Random(scenario)
+
+    def timed(i):
+        start = time.perf_counter()
+        response = make_request(client, scenario, accounts, i, rng)
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f"{scenario}: {response.status_code} {response.text[:200]}")
+        return elapsed
+
+    if counter is not None:
+        counter["n"] = 0
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = list(pool.map(timed, range(requests)))
+    else:
+        timings = [timed(i) for i in range(requests)]
+    elapsed = time.perf_counter() - start
+
+    return summarize(timings, elapsed, counter["n"] if counter is not None else None)
+
+def count_statements(counter):
+    from sqlalchemy import event
+    from app import database, storage
+
+    engines = [database.engine]
+    if database.read_engine is not database.engine:
+        engines.append(database.read_engine)
+    if database.async_engine is not None:
+        engines.append(database.async_engine.sync_engine)
+    # with --shards the per-user statements run on the shard files
+    engines += storage.backend.engines()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter["n"] += 1
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la API de HealthFlow")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--mode", choices=["testclient", "uvicorn"], default="testclient")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--no-cache", action="store_true", help="disable the dashboard response cache")
+    parser.add_argument("--shards", type=int, default=0, help="split user data across this many sqlite files")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # settings are read at import time, so the environment is prepared before importing the app
+    workdir = tempfile.mkdtemp(prefix="healthflow-bench-")
+    os.environ["HEALTHFLOW_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    if args.no_cache:
+        os.environ["HEALTHFLOW_CACHE_MAX_ENTRIES"] = "0"
+    if args.shards:
+        os.environ["HEALTHFLOW_DB_SHARDS"] = str(args.shards)
+        os.environ["HEALTHFLOW_DB_SHARD_URL"] = f"sqlite:///{os.path.join(workdir, 'bench_shard{shard}.db')}"
+
+    from app import database, migrations, storage
+    from benchmarks.datagen import populate
+
+    migrations.upgrade(database.engine)
+    for shard_engine in storage.backend.engines():
+        migrations.upgrade(shard_engine)
+    populate_start = time.perf_counter()
+    accounts = populate(database.SessionLocal, args.users, args.days, storage.backend)
+    print(f"populated {args.users} users x {args.days} days in {time.perf_counter() - populate_start:.1f}s")
+
+    results = {}
+    if args.mode == "testclient":
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        counter = {"n": 0}
+        count_statements(counter)
+        with TestClient(app) as client:
+            accounts = authenticate(client, accounts)
+            for scenario in args.scenarios:
+                results[scenario] = run_scenario(client, scenario, accounts, args.requests, args.concurrency, counter)
+                print(scenario, results[scenario])
+    else:
+        import httpx
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            env=os.environ.copy()
+        )
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+                for _ in range(100):
+                    try:
+                        client.get("/docs")
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.1)
+                accounts = authenticate(client, accounts)
+                for scenario in args.scenarios:
+                    results[scenario] = run_scenario(client, scenario, accounts, args.requests, args.concurrency)
+                    print(scenario, results[scenario])
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "scenarios": results
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
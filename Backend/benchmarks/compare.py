@@ -0,0 +1,34 @@
+# compares two result files written by benchmarks.api --output
+#
+#   python -m benchmarks.compare results/old.json results/new.json
+import argparse
+import json
+
+METRICS = ["rps", "p50_ms", "p95_ms", "p99_ms", "statements_per_request"]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    for scenario, new in candidate["scenarios"].items():
+        old = baseline["scenarios"].get(scenario)
+        if old is None:
+            continue
+        changes = []
+        for metric in METRICS:
+            if old.get(metric) is None or new.get(metric) is None:
+                continue
+            delta = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            changes.append(f"{metric} {old[metric]} -> {new[metric]} ({delta:+.1f}%)")
+        print(f"{scenario}: " + ", ".join(changes))
+
+if __name__ == "__main__":
+    main()
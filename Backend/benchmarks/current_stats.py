@@ -0,0 +1,92 @@
+# benchmark for /dashboard/{user_id}/current: the previous eight-query path vs the
+# single-statement snapshot in crud.get_current_stats
+#
+#   cd backend
+#   python -m benchmarks.current_stats --days 365 --runs 500
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.models import Base
+
+def legacy_current_stats(db, user_id):
+    # the endpoint as it was: user lookup + seven queries, today's rows summed in python
+    today = datetime.now().date()
+    crud.get_user(db, user_id)
+    weight = db.query(models.Weight).filter(models.Weight.user_id == user_id).order_by(models.Weight.date.desc()).first()
+    height = db.query(models.Height).filter(models.Height.user_id == user_id).order_by(models.Height.date.desc()).first()
+    db.query(models.BodyComposition).filter(models.BodyComposition.user_id == user_id).order_by(models.BodyComposition.date.desc()).first()
+    sum(w.water_amount for w in db.query(models.WaterConsumption).filter(
+        models.WaterConsumption.user_id == user_id, func.date(models.WaterConsumption.date) == today).all())
+    sum(s.steps_amount for s in db.query(models.DailySteps).filter(
+        models.DailySteps.user_id == user_id, func.date(models.DailySteps.date) == today).all())
+    db.query(models.Exercise.exercise_name, func.sum(models.Exercise.duration)).filter(
+        models.Exercise.user_id == user_id, func.date(models.Exercise.date) == today
+    ).group_by(models.Exercise.exercise_name).all()
+    db.query(models.BodyFatPercentage).filter(models.BodyFatPercentage.user_id == user_id).order_by(models.BodyFatPercentage.date.desc()).first()
+    return weight, height
+
+def seed(db, user_id, days):
+    now = datetime.now()
+    db.add(models.User(id=user_id, email=f"user{user_id}@example.com", username=f"user{user_id}",
+                       password="x", birthday=datetime(1990, 1, 1), gender="Femenino"))
+    db.commit()
+    crud.import_user_data(db, user_id, "height", [{"date": now.isoformat(), "height": 170}])
+    crud.import_user_data(db, user_id, "weight", [
+        {"date": (now - timedelta(days=d)).isoformat(), "weight": 70 + d % 5} for d in range(days)])
+    crud.import_user_data(db, user_id, "body_composition", [
+        {"date": (now - timedelta(days=d)).isoformat(), "fat": 20, "muscle": 40, "water": 55} for d in range(days)])
+    crud.import_user_data(db, user_id, "body_fat", [
+        {"date": (now - timedelta(days=d)).isoformat(), "fat_percentage": 21} for d in range(days)])
+    # hourly water and steps, a couple of workouts a day
+    crud.import_user_data(db, user_id, "water", [
+        {"date": (now - timedelta(hours=h)).isoformat(), "water_amount": 1} for h in range(days * 24)])
+    crud.import_user_data(db, user_id, "steps", [
+        {"date": (now - timedelta(hours=h)).isoformat(), "steps_amount": 400} for h in range(days * 24)])
+    crud.import_user_data(db, user_id, "exercise", [
+        {"date": (now - timedelta(hours=h)).isoformat(), "exercise_name": "run" if h % 2 else "bike", "duration": 30}
+        for h in range(0, days * 24, 12)])
+
+def measure(session_factory, fn, user_id, runs, counter):
+    timings = []
+    with session_factory() as db:
+        counter["n"] = 0
+        fn(db, user_id)
+        queries = counter["n"]
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn(db, user_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    quantiles = statistics.quantiles(timings, n=100)
+    return {"queries": queries, "p50_ms": round(quantiles[49], 3), "p99_ms": round(quantiles[98], 3)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+
+    counter = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter["n"] += 1
+
+    with session_factory() as db:
+        seed(db, 1, args.days)
+
+    for name, fn in [("before", legacy_current_stats), ("after", crud.get_current_stats)]:
+        print(name, measure(session_factory, fn, 1, args.runs, counter))
+
+if __name__ == "__main__":
+    main()
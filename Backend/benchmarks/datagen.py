@@ -0,0 +1,74 @@
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+from app import crud, schemas
+
+# synthetic wearable data: a scale reading a day, hourly water and steps, a workout or two a day
+
+def generate_user_data(days: int, seed: int = 0, end: datetime = None) -> Dict[str, List[Dict[str, Any]]]:
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    start = end - timedelta(days=days)
+    weight = rng.uniform(55, 95)
+    fat = rng.uniform(15, 30)
+
+    data = {key: [] for key in crud.IMPORT_MODELS}
+    data["height"].append({"date": start.isoformat(), "height": round(rng.uniform(150, 195), 1)})
+
+    for day in range(days):
+        morning = start + timedelta(days=day, hours=7, minutes=rng.randint(0, 59))
+        weight += rng.gauss(0, 0.2)
+        fat += rng.gauss(0, 0.1)
+        data["weight"].append({"date": morning.isoformat(), "weight": round(weight, 1)})
+        data["body_fat"].append({"date": morning.isoformat(), "fat_percentage": round(fat, 1)})
+        data["body_composition"].append({
+            "date": morning.isoformat(),
+            "fat": round(fat, 1),
+            "muscle": round(rng.uniform(35, 45), 1),
+            "water": round(rng.uniform(50, 60), 1)
+        })
+
+        for hour in range(7, 23):
+            moment = start + timedelta(days=day, hours=hour, minutes=rng.randint(0, 59))
+            if rng.random() < 0.5:
+                data["water"].append({"date": moment.isoformat(), "water_amount": 1})
+            data["steps"].append({"date": moment.isoformat(), "steps_amount": rng.randint(0, 1500)})
+
+        for _ in range(rng.randint(0, 2)):
+            moment = start + timedelta(days=day, hours=rng.randint(6, 21), minutes=rng.randint(0, 59))
+            data["exercise"].append({
+                "date": moment.isoformat(),
+                "exercise_name": rng.choice(["Correr", "Bicicleta", "Natación", "Pesas"]),
+                "duration": rng.randint(15, 90)
+            })
+
+    return data
+
+def populate(session_factory, users: int, days: int, storage=None):
+    # creates users with their history and returns (user_id, username, password) for each;
+    # with a sharded app.storage backend the measurements go to each user's shard
+    accounts = []
+    db = session_factory()
+    try:
+        for i in range(users):
+            password = "Benchmark#2024"
+            user = crud.create_user(db, schemas.UserCreate(
+                email=f"bench{i}@example.com",
+                username=f"bench{i}",
+                password=password,
+                birthday=datetime(1970 + i % 40, 1 + i % 12, 1),
+                gender="Masculino" if i % 2 else "Femenino",
+                current_weight=70,
+                current_height=170
+            ), storage.user_data_session if storage else None)
+            data_db = storage.session(user.id) if storage else db
+            try:
+                for import_type, rows in generate_user_data(days, seed=i).items():
+                    crud.import_user_data(data_db, user.id, import_type, rows)
+            finally:
+                if data_db is not db:
+                    data_db.close()
+            accounts.append((user.id, user.username, password))
+    finally:
+        db.close()
+    return accounts
@@ -0,0 +1,111 @@
+# login throughput at a given scrypt cost: raw hash time on the password pool, then
+# /login under concurrency, in process (TestClient) or against a local uvicorn
+#
+#   cd backend
+#   python -m benchmarks.login --n 16384 --workers 4 --requests 200 --concurrency 16
+#   python -m benchmarks.login --n 32768 --mode uvicorn --output results/login.json
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+def hash_timings(hasher, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        hasher.hash("Benchmark#2024")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def pool_throughput(hasher, runs):
+    start = time.perf_counter()
+    futures = [hasher.executor.submit(hasher._hash, "Benchmark#2024") for _ in range(runs)]
+    for future in futures:
+        future.result()
+    return runs / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del login con hashing de contraseñas")
+    parser.add_argument("--n", type=int, default=16384, help="scrypt cost (power of two)")
+    parser.add_argument("--r", type=int, default=8)
+    parser.add_argument("--p", type=int, default=1)
+    parser.add_argument("--workers", type=int, help="password pool size (HEALTHFLOW_PASSWORD_WORKERS)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", choices=["testclient", "uvicorn"], default="testclient")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # cost and pool size are read at import time
+    workdir = tempfile.mkdtemp(prefix="healthflow-login-")
+    os.environ["HEALTHFLOW_DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["HEALTHFLOW_SCRYPT_N"] = str(args.n)
+    os.environ["HEALTHFLOW_SCRYPT_R"] = str(args.r)
+    os.environ["HEALTHFLOW_SCRYPT_P"] = str(args.p)
+    if args.workers:
+        os.environ["HEALTHFLOW_PASSWORD_WORKERS"] = str(args.workers)
+
+    from app import database, migrations, passwords
+    from benchmarks.api import authenticate, git_commit, free_port, run_scenario
+    from benchmarks.datagen import populate
+
+    hasher = passwords.hasher
+    timings = hash_timings(hasher, 20)
+    results = {"hash": {
+        "hash_ms": round(statistics.median(timings), 2),
+        "pool_hashes_per_second": round(pool_throughput(hasher, 100), 1),
+        "pool_workers": hasher.executor._max_workers
+    }}
+    print("hash", results["hash"])
+
+    migrations.upgrade(database.engine)
+    accounts = populate(database.SessionLocal, args.users, 1)
+
+    if args.mode == "testclient":
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        with TestClient(app) as client:
+            accounts = authenticate(client, accounts)
+            results["login"] = run_scenario(client, "login", accounts, args.requests, args.concurrency)
+    else:
+        import httpx
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            env=os.environ.copy()
+        )
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+                for _ in range(100):
+                    try:
+                        client.get("/docs")
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.1)
+                accounts = authenticate(client, accounts)
+                results["login"] = run_scenario(client, "login", accounts, args.requests, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait()
+    print("login", results["login"])
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": git_commit(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "config": vars(args),
+                "scenarios": results
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import uuid
+from datetime import datetime
+
+# every database, shard and archive file goes to a throwaway directory; set before
+# the app is imported, since settings are read at import time
+_data_dir = tempfile.mkdtemp(prefix="healthflow-tests-")
+os.environ.setdefault("HEALTHFLOW_DATABASE_URL", f"sqlite:///{_data_dir}/health_tracker.db")
+os.environ.setdefault("HEALTHFLOW_DB_SHARD_URL", f"sqlite:///{_data_dir}/health_tracker_shard{{shard}}.db")
+os.environ.setdefault("HEALTHFLOW_ARCHIVE_DIR", os.path.join(_data_dir, "archive"))
+# cheap password hashes, the cost isn't what's under test
+os.environ.setdefault("HEALTHFLOW_SCRYPT_N", "16")
+
+import pytest
+from fastapi.testclient import TestClient
+from app import crud, storage, tokens
+from app.main import app
+
+PASSWORD = "Abcdefgh1!x"
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+def register(client, **fields):
+    name = uuid.uuid4().hex[:12]
+    body = {
+        "email": f"{name}@example.com",
+        "username": name,
+        "birthday": "1990-01-01T00:00:00",
+        "gender": "Femenino",
+        "password": PASSWORD,
+        "current_weight": 70,
+        "current_height": 170,
+        **fields
+    }
+    response = client.post("/register", json=body)
+    assert response.status_code == 200, response.text
+    login = client.post("/login", json={"username": name, "password": PASSWORD})
+    assert login.status_code == 200, login.text
+    return response.json()["id"], {"Authorization": f"Bearer {login.json()['access_token']}"}, body
+
+@pytest.fixture
+def user(client):
+    # (user_id, auth headers) of a fresh user, so tests never share data
+    user_id, headers, _ = register(client)
+    return user_id, headers
+
+@pytest.fixture
+def staff(user, monkeypatch):
+    # the user, allowed on the cohort analytics
+    monkeypatch.setattr(tokens, "STAFF_USER_IDS", {user[0]})
+    return user
+
+def data_version(user_id):
+    db = storage.backend.session(user_id, read_only=True)
+    try:
+        return crud.get_data_version(db, user_id)
+    finally:
+        db.close()
+
+def import_rows(client, user, import_type, rows, headers=None):
+    user_id, auth = user
+    response = client.post(
+        f"/users/{user_id}/import",
+        json={"import_type": import_type, "data": rows},
+        headers={**auth, **(headers or {})}
+    )
+    assert response.status_code == 200, response.text
+    return response
+
+def iso(moment: datetime) -> str:
+    return moment.isoformat()
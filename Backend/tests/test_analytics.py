@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+import pytest
+from .conftest import import_rows, iso
+
+def test_water_trend_ignores_rows_after_today(client, staff):
+    now = datetime.now()
+    import_rows(client, staff, "water", [
+        {"date": iso(now), "water_amount": 3},
+        {"date": iso(now + timedelta(days=1)), "water_amount": 2}
+    ])
+    response = client.get("/analytics/water/trend", params={"period": "1m"}, headers=staff[1])
+    assert response.status_code == 200, response.text
+    assert response.json()["data"][-1]["date"] == now.date().isoformat()
+
+# weeks nobody logged must not reach nanpercentile
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_weekly_steps_ignore_rows_in_a_later_week(client, staff):
+    now = datetime.now()
+    import_rows(client, staff, "steps", [
+        {"date": iso(now), "steps_amount": 4000},
+        {"date": iso(now + timedelta(days=8)), "steps_amount": 9000}
+    ])
+    response = client.get("/analytics/steps/weekly", params={"period": "1m"}, headers=staff[1])
+    assert response.status_code == 200, response.text
+    assert response.json()[-1]["week"] <= now.date().isoformat()
+
+def test_analytics_are_staff_only(client, user):
+    for url in ("/analytics/bmi", "/analytics/steps/weekly", "/analytics/water/trend"):
+        assert client.get(url).status_code == 401
+        assert client.get(url, headers=user[1]).status_code == 403
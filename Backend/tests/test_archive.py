@@ -0,0 +1,136 @@
+import os
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import select
+from app import archive, cache, models, storage
+from .conftest import import_rows, iso
+
+@pytest.fixture(autouse=True)
+def archive_after(monkeypatch):
+    # the default keeps a whole year live, past the longest period
+    monkeypatch.setattr(archive, "ARCHIVE_AFTER_DAYS", 60)
+
+def _archive(user_id, before):
+    db = storage.backend.session(user_id)
+    try:
+        return archive.archive_user(db, user_id, before)
+    finally:
+        db.close()
+
+def _derived(user_id, metric):
+    db = storage.backend.session(user_id, read_only=True)
+    try:
+        rows = db.execute(select(models.DailyMetric.day, models.DailyMetric.value, models.DailyMetric.avg_7d).where(
+            models.DailyMetric.user_id == user_id,
+            models.DailyMetric.metric == metric
+        )).all()
+        return {row.day: (row.value, row.avg_7d) for row in rows}
+    finally:
+        db.close()
+
+def test_height_import_recomputes_bmi_over_archived_weights(client, user):
+    user_id, _ = user
+    now = datetime.now().replace(microsecond=0)
+    import_rows(client, user, "weight", [
+        {"date": iso(now - timedelta(days=days)), "weight": 81.0} for days in range(1, 400)
+    ])
+    assert _archive(user_id, archive.cutoff()) > 0
+
+    import_rows(client, user, "height", [{"date": iso(now - timedelta(days=250)), "height": 180}])
+
+    series = _derived(user_id, "bmi")
+    for days in (300, 200, 100):
+        value, avg_7d = series[date.today() - timedelta(days=days)]
+        assert round(value, 2) == round(avg_7d, 2) == 25.0
+
+def _import_year(client, user):
+    now = datetime.now().replace(microsecond=0)
+    import_rows(client, user, "weight", [
+        {"date": iso(now - timedelta(days=days, hours=days % 5)), "weight": 70 + days % 30 / 10} for days in range(1, 330)
+    ])
+    import_rows(client, user, "steps", [
+        {"date": iso(now - timedelta(hours=7 * i)), "steps_amount": i % 997} for i in range(1100)
+    ])
+    return now
+
+def _live_rows(user_id, model):
+    db = storage.backend.session(user_id, read_only=True)
+    try:
+        return db.query(model).filter(model.user_id == user_id).count()
+    finally:
+        db.close()
+
+def _manifest(user_id, import_type):
+    db = storage.backend.session(user_id, read_only=True)
+    try:
+        return archive.archived_months(db, user_id, import_type)
+    finally:
+        db.close()
+
+def _responses(client, user):
+    # cached responses are keyed by data version, which archiving leaves alone
+    cache.response_cache.clear()
+    user_id, headers = user
+    out = {"current": client.get(f"/dashboard/{user_id}/current", headers=headers).json()}
+    for metric in ("weight", "steps"):
+        for resolution in ("raw", "day", "month"):
+            out[metric, resolution] = client.get(
+                f"/dashboard/{user_id}/history", params={"metric": metric, "period": "1y", "resolution": resolution}, headers=headers
+            ).json()
+        out[metric, "derived"] = client.get(
+            f"/dashboard/{user_id}/derived", params={"metric": metric, "period": "1y"}, headers=headers
+        ).json()
+    out["export"] = client.get(f"/users/{user_id}/export", params={"format": "ndjson"}, headers=headers).text
+    return out
+
+def test_archiving_leaves_responses_unchanged(client, user):
+    user_id, _ = user
+    _import_year(client, user)
+    before = _responses(client, user)
+
+    assert _archive(user_id, archive.cutoff()) > 0
+    assert _live_rows(user_id, models.Weight) < 100
+    months = _manifest(user_id, "weight")
+    assert months and all(os.path.exists(archive.archive_path(user_id, "weight", month)) for month in months)
+    assert _responses(client, user) == before
+    # nothing left to move
+    assert _archive(user_id, archive.cutoff()) == 0
+
+def test_import_into_an_archived_month_thaws_it(client, user):
+    user_id, headers = user
+    now = _import_year(client, user)
+    _archive(user_id, archive.cutoff())
+    old = now - timedelta(days=200)
+    month = old.date().replace(day=1)
+    assert month in _manifest(user_id, "weight")
+
+    result = import_rows(client, user, "weight", [{"date": iso(old), "weight": 99.0}]).json()
+    assert result["updated"] == 1
+    assert month not in _manifest(user_id, "weight")
+    assert not os.path.exists(archive.archive_path(user_id, "weight", month))
+
+    history = client.get(
+        f"/dashboard/{user_id}/history", params={"metric": "weight", "period": "1y", "resolution": "raw"}, headers=headers
+    ).json()
+    assert {"date": iso(old), "value": 99.0} in history
+    # the thawed month is archived again on the next run
+    assert _archive(user_id, archive.cutoff()) > 0
+    assert month in _manifest(user_id, "weight")
+
+def test_restore_user_brings_every_month_back(client, user):
+    user_id, _ = user
+    _import_year(client, user)
+    live = _live_rows(user_id, models.Weight)
+    before = _responses(client, user)
+    _archive(user_id, archive.cutoff())
+    months = _manifest(user_id, "weight")
+
+    db = storage.backend.session(user_id)
+    try:
+        assert archive.restore_user(db, user_id) > 0
+    finally:
+        db.close()
+    assert _manifest(user_id, "weight") == [] and _manifest(user_id, "steps") == []
+    assert not any(os.path.exists(archive.archive_path(user_id, "weight", month)) for month in months)
+    assert _live_rows(user_id, models.Weight) == live
+    assert _responses(client, user) == before
@@ -0,0 +1,48 @@
+import time
+from app.cache import ResponseCache
+
+def test_lru_eviction_by_entries():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60, max_bytes=10_000)
+    cache.set((1, "a"), 1)
+    cache.set((1, "b"), 2)
+    assert cache.get((1, "a")) == 1  # a is now the most recent
+    cache.set((1, "c"), 3)
+    assert cache.get((1, "b")) is None
+    assert cache.get((1, "a")) == 1
+    assert cache.stats()["evictions"] == 1
+
+def test_eviction_by_bytes_and_oversized_values():
+    cache = ResponseCache(max_entries=100, ttl_seconds=60, max_bytes=20)
+    cache.set((1, "big"), "x" * 50)
+    assert cache.get((1, "big")) is None
+    cache.set((1, "a"), "x" * 9)
+    cache.set((1, "b"), "x" * 9)
+    assert cache.get((1, "a")) is None
+    assert cache.stats()["bytes"] <= 20
+
+def test_expired_entries_miss():
+    cache = ResponseCache(max_entries=10, ttl_seconds=0.01, max_bytes=10_000)
+    cache.set((1, "a"), 1)
+    time.sleep(0.02)
+    assert cache.get((1, "a")) is None
+    assert cache.stats()["entries"] == 0
+
+def test_invalidate_user_only_drops_that_user():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60, max_bytes=10_000)
+    cache.set((1, "a"), 1)
+    cache.set((1, "b"), 2)
+    cache.set((2, "a"), 3)
+    cache.invalidate_user(1)
+    assert cache.get((1, "a")) is None
+    assert cache.get((1, "b")) is None
+    assert cache.get((2, "a")) == 3
+    assert cache.stats()["invalidations"] == 2
+
+def test_set_racing_an_invalidation_is_dropped():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60, max_bytes=10_000)
+    generation = cache.generation(1)
+    cache.invalidate_user(1)  # a write lands while the value is computed
+    cache.set((1, "a"), "stale", generation)
+    assert cache.get((1, "a")) is None
+    cache.set((1, "a"), "fresh", cache.generation(1))
+    assert cache.get((1, "a")) == "fresh"
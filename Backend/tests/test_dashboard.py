@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+from app import columnar, crud, crud_async, storage
+from app.database import settings
+from .conftest import import_rows, iso
+
+def test_current_stats_etag_and_304(client, user):
+    user_id, headers = user
+    url = f"/dashboard/{user_id}/current"
+    first = client.get(url, headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    not_modified = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    import_rows(client, user, "water", [{"date": iso(datetime.now()), "water_amount": 3}])
+    changed = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["water_consumed"] == 3
+
+def test_read_overlapping_an_import_is_not_served_after_it(client, user, monkeypatch):
+    # the import commits (and invalidates) while the read is computing; the read then
+    # stores its pre-import body, which must not come back under the new version
+    user_id, headers = user
+    url = f"/dashboard/{user_id}/current"
+    module = crud_async if settings.async_db else crud
+    get_current_stats = module.get_current_stats
+
+    def run_import():
+        import_db = storage.backend.session(user_id)
+        try:
+            crud.import_user_data(import_db, user_id, "water", [{"date": iso(datetime.now()), "water_amount": 5}])
+        finally:
+            import_db.close()
+
+    def overlapping(db, user_id):
+        stats = get_current_stats(db, user_id)
+        run_import()
+        return stats
+
+    async def overlapping_async(db, user_id):
+        stats = await get_current_stats(db, user_id)
+        run_import()
+        return stats
+
+    monkeypatch.setattr(module, "get_current_stats", overlapping_async if settings.async_db else overlapping)
+    assert client.get(url, headers=headers).json()["water_consumed"] == 0
+    monkeypatch.undo()
+    assert client.get(url, headers=headers).json()["water_consumed"] == 5
+
+def test_history_batch_etag(client, user):
+    user_id, headers = user
+    params = {"metrics": ["weight", "steps"], "period": "1m"}
+    first = client.get(f"/dashboard/{user_id}/history/batch", params=params, headers=headers)
+    assert first.status_code == 200
+    assert set(first.json()) == {"weight", "steps"}
+    again = client.get(
+        f"/dashboard/{user_id}/history/batch", params=params,
+        headers={**headers, "If-None-Match": first.headers["etag"]}
+    )
+    assert again.status_code == 304
+
+def test_history_formats_have_their_own_etags(client, user):
+    user_id, headers = user
+    url = f"/dashboard/{user_id}/history"
+    params = {"metric": "weight", "period": "1m"}
+    responses = {
+        accept: client.get(url, params=params, headers={**headers, "Accept": accept})
+        for accept in ("application/json", columnar.COLUMNAR_JSON, columnar.PACKED_JSON)
+    }
+    for accept, response in responses.items():
+        assert response.status_code == 200
+        assert "Accept" in response.headers["vary"]
+    assert len({response.headers["etag"] for response in responses.values()}) == 3
+
+    # the json etag doesn't validate the columnar body
+    json_etag = responses["application/json"].headers["etag"]
+    other = client.get(url, params=params, headers={**headers, "Accept": columnar.PACKED_JSON, "If-None-Match": json_etag})
+    assert other.status_code == 200
+    assert other.headers["content-type"].startswith(columnar.PACKED_JSON)
+    same = client.get(url, params=params, headers={**headers, "Accept": "application/json", "If-None-Match": json_etag})
+    assert same.status_code == 304
+    assert "Accept" in same.headers["vary"]
+
+def test_history_max_points(client, user):
+    user_id, headers = user
+    now = datetime.now().replace(microsecond=0)
+    import_rows(client, user, "weight", [{"date": iso(now - timedelta(hours=i)), "weight": 70 + i % 5} for i in range(300)])
+    response = client.get(
+        f"/dashboard/{user_id}/history", params={"metric": "weight", "period": "1m", "max_points": 30}, headers=headers
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 30
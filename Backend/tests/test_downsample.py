@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+from app import downsample
+
+def _series(values):
+    start = datetime(2026, 1, 1)
+    return [{"date": start + timedelta(hours=i), "value": value} for i, value in enumerate(values)]
+
+def test_short_series_and_small_limits_are_untouched():
+    points = _series([1, 2, 3, 4])
+    assert downsample.lttb(points, 10) is points
+    assert downsample.lttb(points, 2) is points
+
+def test_keeps_ends_and_bounds_the_length():
+    points = _series([i % 7 for i in range(1000)])
+    reduced = downsample.lttb(points, 50)
+    assert len(reduced) == 50
+    assert reduced[0] is points[0]
+    assert reduced[-1] is points[-1]
+    assert [point["date"] for point in reduced] == sorted(point["date"] for point in reduced)
+
+def test_keeps_a_spike():
+    values = [10.0] * 500
+    values[321] = 90.0
+    reduced = downsample.lttb(_series(values), 20)
+    assert 90.0 in [point["value"] for point in reduced]
@@ -0,0 +1,47 @@
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta
+from app import export
+from .conftest import import_rows
+
+def _steps(count):
+    start = datetime(2026, 3, 1, 8)
+    return [{"date": (start + timedelta(hours=i)).isoformat(), "steps_amount": 100 + i} for i in range(count)]
+
+def test_ndjson_export_in_date_order(client, user, monkeypatch):
+    # several partitions
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 7)
+    user_id, headers = user
+    rows = _steps(30)
+    import_rows(client, user, "steps", rows[::-1])
+    response = client.get(f"/users/{user_id}/export", params={"format": "ndjson", "import_type": "steps"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"type": "steps", **row} for row in rows]
+
+def test_csv_export_goes_back_into_the_import(client, user):
+    user_id, headers = user
+    import_rows(client, user, "steps", _steps(5))
+    response = client.get(f"/users/{user_id}/export", params={"format": "csv", "import_type": "steps"}, headers=headers)
+    assert response.status_code == 200
+    assert response.text.splitlines()[0] == "date,steps_amount"
+    resent = client.post(
+        f"/users/{user_id}/import/stream", params={"import_type": "steps"}, content=response.content,
+        headers={**headers, "Content-Type": "text/csv"}
+    )
+    assert resent.json()["unchanged"] == 5
+
+def test_zip_export_has_a_csv_per_metric(client, user):
+    user_id, headers = user
+    response = client.get(f"/users/{user_id}/export", params={"format": "zip"}, headers=headers)
+    assert response.status_code == 200
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    assert sorted(names) == sorted(f"{import_type}.csv" for import_type in export.crud.IMPORT_MODELS)
+
+def test_export_rejects_bad_requests(client, user):
+    user_id, headers = user
+    assert client.get(f"/users/{user_id}/export", params={"format": "xml"}, headers=headers).status_code == 400
+    assert client.get(f"/users/{user_id}/export", params={"format": "csv"}, headers=headers).status_code == 400
+    assert client.get(f"/users/{user_id}/export", params={"format": "ndjson"}).status_code == 401
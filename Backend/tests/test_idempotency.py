@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from .conftest import data_version, import_rows, register
+
+# fixed, so two calls build the same body
+NOW = datetime.now().replace(microsecond=0)
+
+def _weights(count, weight=70.0):
+    return [{"date": (NOW - timedelta(hours=i)).isoformat(), "weight": weight} for i in range(count)]
+
+def test_same_body_is_replayed(client, user):
+    body = _weights(5)
+    first = import_rows(client, user, "weight", body)
+    assert "idempotent-replayed" not in first.headers
+    version = data_version(user[0])
+
+    replay = import_rows(client, user, "weight", body)
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.json() == first.json()
+    assert data_version(user[0]) == version
+
+def test_same_body_runs_again_after_other_writes(client, user):
+    body = _weights(3)
+    import_rows(client, user, "weight", body)
+    import_rows(client, user, "weight", _weights(1, 80.0))
+    # the second import changed one of the rows, so the first body has an effect again
+    again = import_rows(client, user, "weight", body)
+    assert "idempotent-replayed" not in again.headers
+    assert again.json()["updated"] == 1
+    assert again.json()["unchanged"] == 2
+
+def test_idempotency_key(client, user):
+    key = {"Idempotency-Key": "abc-123"}
+    first = import_rows(client, user, "weight", _weights(2), key)
+    import_rows(client, user, "weight", _weights(2, 75.0))
+    replay = import_rows(client, user, "weight", _weights(2), key)
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.json() == first.json()
+
+    reused = client.post(
+        f"/users/{user[0]}/import", json={"import_type": "weight", "data": _weights(4)}, headers={**user[1], **key}
+    )
+    assert reused.status_code == 400
+
+def test_idempotency_key_on_stream(client, user):
+    user_id, headers = user
+    headers = {**headers, "Idempotency-Key": "stream-1"}
+    body = '{"date": "2026-05-01T08:00:00", "weight": 70}\n'
+    first = client.post(f"/users/{user_id}/import/stream", params={"import_type": "weight"}, content=body, headers=headers)
+    assert first.json()["inserted"] == 1
+    replay = client.post(f"/users/{user_id}/import/stream", params={"import_type": "weight"}, content=body, headers=headers)
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.json() == first.json()
+
+def test_keys_are_per_user(client, user):
+    other_id, other_headers, _ = register(client)
+    key = {"Idempotency-Key": "shared"}
+    import_rows(client, user, "weight", _weights(2), key)
+    response = client.post(
+        f"/users/{other_id}/import", json={"import_type": "weight", "data": _weights(1)},
+        headers={**other_headers, **key}
+    )
+    assert "idempotent-replayed" not in response.headers
+    assert response.json()["inserted"] == 1
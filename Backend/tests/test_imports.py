@@ -0,0 +1,87 @@
+import json
+from datetime import datetime, timedelta
+from app import crud
+from .conftest import data_version, import_rows, iso
+
+def _steps(count, amount=100):
+    now = datetime.now().replace(microsecond=0)
+    return [{"date": iso(now - timedelta(hours=i)), "steps_amount": amount + i} for i in range(count)]
+
+def _counts(response):
+    return {key: value for key, value in response.json().items() if key != "message"}
+
+def test_import_counts_inserts_updates_and_rejects(client, user):
+    rows = _steps(3)
+    response = import_rows(client, user, "steps", rows + [{"date": "no es fecha", "steps_amount": 1}])
+    assert _counts(response) == {"inserted": 3, "updated": 0, "unchanged": 0, "rejected": 1}
+
+    rows[0]["steps_amount"] = 999
+    response = import_rows(client, user, "steps", rows + [{"date": iso(datetime(2026, 1, 1)), "steps_amount": 5}])
+    assert _counts(response) == {"inserted": 1, "updated": 1, "unchanged": 2, "rejected": 0}
+
+def test_repeated_timestamp_in_a_batch_keeps_the_last_value(client, user):
+    moment = iso(datetime.now().replace(microsecond=0) - timedelta(days=2))
+    response = import_rows(client, user, "weight", [
+        {"date": moment, "weight": 70.0},
+        {"date": moment, "weight": 71.5}
+    ])
+    assert _counts(response)["inserted"] == 1
+    history = client.get(f"/dashboard/{user[0]}/history", params={"metric": "weight", "period": "1w"}, headers=user[1])
+    assert 71.5 in [point["value"] for point in history.json()]
+
+def test_resend_writes_nothing(client, user):
+    rows = _steps(1200)
+    import_rows(client, user, "steps", rows)
+    version = data_version(user[0])
+    # a different body (reordered) so the request isn't replayed as a whole
+    response = import_rows(client, user, "steps", rows[::-1])
+    assert _counts(response) == {"inserted": 0, "updated": 0, "unchanged": 1200, "rejected": 0}
+    assert data_version(user[0]) == version
+
+def test_resend_with_utc_offsets_writes_nothing(client, user):
+    rows = [
+        {"date": "2026-10-10T08:00:00+00:00", "water_amount": 2},
+        {"date": "2026-10-10T12:00:00Z", "water_amount": 1},
+        {"date": "2026-10-10T16:00:00+02:00", "water_amount": 3}
+    ]
+    assert _counts(import_rows(client, user, "water", rows))["inserted"] == 3
+    version = data_version(user[0])
+    response = import_rows(client, user, "water", rows[::-1])
+    assert _counts(response) == {"inserted": 0, "updated": 0, "unchanged": 3, "rejected": 0}
+    assert data_version(user[0]) == version
+
+def test_stream_import_ndjson_and_csv(client, user):
+    user_id, headers = user
+    rows = _steps(3)
+    body = "\n".join(json.dumps(row) for row in rows) + "\n{not json\n"
+    response = client.post(f"/users/{user_id}/import/stream", params={"import_type": "steps"}, content=body, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["inserted"] == 3
+    assert response.json()["rejected"] == 1
+
+    csv = "date,steps_amount\n" + "\n".join(f"{row['date']},{row['steps_amount']}" for row in rows) + "\nfecha,abc\n"
+    response = client.post(
+        f"/users/{user_id}/import/stream", params={"import_type": "steps"}, content=csv,
+        headers={**headers, "Content-Type": "text/csv"}
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["unchanged"] == 3
+    assert response.json()["rejected"] == 1
+
+def test_invalid_import_type(client, user):
+    response = client.post(f"/users/{user[0]}/import", json={"import_type": "sleep", "data": []}, headers=user[1])
+    assert response.status_code == 400
+
+def test_upsert_replaces_values_and_rollups(client, user):
+    # more rows than one batch, then new values for some of them
+    user_id, headers = user
+    now = datetime.now().replace(microsecond=0)
+    rows = [{"date": iso(now - timedelta(minutes=i)), "water_amount": 1} for i in range(crud.IMPORT_BATCH_SIZE + 10)]
+    assert _counts(import_rows(client, user, "water", rows))["inserted"] == len(rows)
+    for row in rows[:10]:
+        row["water_amount"] = 3
+    response = import_rows(client, user, "water", rows[:10])
+    assert _counts(response) == {"inserted": 0, "updated": 10, "unchanged": 0, "rejected": 0}
+
+    history = client.get(f"/dashboard/{user_id}/history", params={"metric": "water", "period": "1w"}, headers=headers)
+    assert history.json()["total"] == len(rows) + 20
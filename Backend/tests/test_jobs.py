@@ -0,0 +1,80 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from app import jobs, storage
+from .conftest import iso
+
+def _rows(count):
+    start = datetime.now().replace(microsecond=0) - timedelta(days=3)
+    return [{"date": iso(start + timedelta(hours=i)), "steps_amount": 100 + i} for i in range(count)]
+
+def _wait(poll):
+    # the job runs on the manager's own pool
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = poll()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("la importación no terminó")
+
+@pytest.fixture
+def manager():
+    manager = jobs.ImportJobManager(storage.backend.session, max_workers=1)
+    yield manager
+    manager.shutdown()
+
+def test_job_runs_to_completion(client, user):
+    user_id, headers = user
+    response = client.post(
+        f"/users/{user_id}/import/jobs", json={"import_type": "steps", "data": _rows(30)}, headers=headers
+    )
+    assert response.status_code == 202, response.text
+    assert response.json()["status"] == "queued" and response.json()["total"] == 30
+
+    job = _wait(lambda: client.get(f"/users/{user_id}/import/{response.json()['job_id']}", headers=headers).json())
+    assert job["status"] == "completed"
+    assert job["processed"] == job["inserted"] == 30
+    assert job["error"] is None and job["finished_at"] is not None
+
+    history = client.get(
+        f"/dashboard/{user_id}/history", params={"metric": "steps", "period": "1y", "resolution": "raw"}, headers=headers
+    )
+    assert history.json()["total"] == sum(row["steps_amount"] for row in _rows(30))
+
+def test_jobs_are_only_visible_to_their_user(client, user, manager):
+    user_id, _ = user
+    job = manager.submit(user_id, "steps", _rows(2))
+    _wait(lambda: manager.get(user_id, job["job_id"]))
+    assert manager.get(user_id + 1, job["job_id"]) is None
+
+def test_failed_job_keeps_its_error(user, manager, monkeypatch):
+    def broken_import(**kwargs):
+        raise RuntimeError("disco lleno")
+
+    monkeypatch.setattr(jobs.crud, "import_user_data", broken_import)
+    user_id, _ = user
+    job = manager.submit(user_id, "steps", _rows(5))
+    job = _wait(lambda: manager.get(user_id, job["job_id"]))
+    assert job["status"] == "failed"
+    assert job["error"] == "disco lleno"
+    assert job["finished_at"] is not None
+
+def test_invalid_import_type_is_rejected(user, manager):
+    with pytest.raises(ValueError):
+        manager.submit(user[0], "sleep", _rows(1))
+    assert manager.jobs == {}
+
+def test_oldest_finished_jobs_are_pruned(user, manager, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_FINISHED_JOBS", 2)
+    user_id, _ = user
+    job_ids = []
+    for _ in range(4):
+        job = manager.submit(user_id, "steps", _rows(1))
+        _wait(lambda: manager.get(user_id, job["job_id"]))
+        job_ids.append(job["job_id"])
+
+    # pruning runs on submit, keeping the newest finished ones and any unfinished job
+    latest = manager.submit(user_id, "steps", _rows(1))
+    assert [manager.get(user_id, job_id) for job_id in job_ids[:2]] == [None, None]
+    assert all(manager.get(user_id, job_id) for job_id in job_ids[2:] + [latest["job_id"]])
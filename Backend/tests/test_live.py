@@ -0,0 +1,51 @@
+import asyncio
+from app.live import LiveHub, delta
+
+def test_delta_only_has_changed_fields():
+    old = {"steps": 100, "water_consumed": 2, "body_composition": {"fat": 20, "muscle": 40}}
+    new = {"steps": 150, "water_consumed": 2, "body_composition": {"fat": 20, "muscle": 41}, "weight": 70}
+    assert delta(old, new) == {"steps": 150, "body_composition": {"muscle": 41}, "weight": 70}
+
+def test_new_stream_starts_from_its_own_stats():
+    async def scenario():
+        hub = LiveHub()
+        hub.start(asyncio.get_running_loop())
+        first = hub.subscribe(1)
+        assert hub.snapshot(1, first, {"steps": 100}) == {"steps": 100}
+
+        # after midnight (or an import on another worker) the new stream reads newer stats
+        second = hub.subscribe(1)
+        assert hub.snapshot(1, second, {"steps": 0}) == {"steps": 0}
+        assert first.get_nowait() == ("delta", {"steps": 0})
+        assert second.empty()
+
+        # later deltas are computed from the fresh state
+        hub.publish(1, lambda: {"steps": 30})
+        await asyncio.sleep(0)
+        assert first.get_nowait() == ("delta", {"steps": 30})
+        assert second.get_nowait() == ("delta", {"steps": 30})
+
+    asyncio.run(scenario())
+
+def test_slow_stream_gets_a_snapshot_instead_of_a_backlog():
+    async def scenario():
+        hub = LiveHub(queue_size=2)
+        hub.start(asyncio.get_running_loop())
+        queue = hub.subscribe(1)
+        hub.snapshot(1, queue, {"steps": 0})
+        for steps in range(1, 5):
+            hub.publish(1, lambda steps=steps: {"steps": steps})
+        await asyncio.sleep(0)
+        messages = [queue.get_nowait() for _ in range(queue.qsize())]
+        assert messages[-1][1] == {"steps": 4}
+        assert ("snapshot", {"steps": 3}) in messages
+
+    asyncio.run(scenario())
+
+def test_unsubscribe_forgets_the_user():
+    hub = LiveHub()
+    queue = hub.subscribe(1)
+    hub.state[1] = {"steps": 1}
+    hub.unsubscribe(1, queue)
+    assert hub.stats() == {"users": 0, "connections": 0}
+    assert 1 not in hub.state
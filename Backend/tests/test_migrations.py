@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+from app import migrations
+from app.models import Base
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    yield engine
+    engine.dispose()
+
+def test_dashboard_queries_use_the_user_date_indexes(engine):
+    migrations.upgrade(engine)
+    assert migrations.check_query_plans(engine) == []
+
+def test_upgrade_adds_indexes_and_columns_to_an_old_database(engine):
+    # an old health_tracker.db: the tables without the later indexes and columns
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for model in migrations.METRIC_MODELS:
+            conn.exec_driver_sql(f"DROP INDEX ix_{model.__tablename__}_user_id_date")
+        conn.exec_driver_sql("ALTER TABLE users DROP COLUMN data_version")
+    assert migrations.check_query_plans(engine) != []
+
+    migrations.upgrade(engine)
+    assert "data_version" in {column["name"] for column in inspect(engine).get_columns("users")}
+    assert migrations.check_query_plans(engine) == []
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, func, insert, select
+from app import models, storage
+from app.models import Base
+
+USER_IDS = range(1, 13)
+
+@pytest.fixture
+def main_engine(tmp_path, monkeypatch):
+    # a single-file database with a few users and their weights
+    engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": user_id, "email": f"user{user_id}@example.com", "username": f"user{user_id}"} for user_id in USER_IDS
+        ])
+        conn.execute(insert(models.Weight), [
+            {"user_id": user_id, "date": datetime(2026, 1, 1) + timedelta(days=day), "weight": 70 + user_id}
+            for user_id in USER_IDS for day in range(3)
+        ])
+    monkeypatch.setattr(storage, "engine", engine)
+    monkeypatch.setattr(storage, "SHARD_URL", f"sqlite:///{tmp_path}/shard{{shard}}.db")
+    yield engine
+    engine.dispose()
+
+def _use_shards(monkeypatch, count):
+    backend = storage.ShardedStorage(count, storage.SHARD_URL)
+    for shard_engine in backend.engines():
+        Base.metadata.create_all(bind=shard_engine)
+    monkeypatch.setattr(storage, "backend", backend)
+    return backend
+
+def _weights(engine):
+    # user_id -> number of weight rows in one file
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.Weight.user_id, func.count()).group_by(models.Weight.user_id)).all()
+    return dict(rows)
+
+def _users(engine):
+    with engine.connect() as conn:
+        return set(conn.execute(select(models.User.id)).scalars())
+
+def test_migrate_single_file_moves_measurements_to_their_shard(main_engine, monkeypatch):
+    backend = _use_shards(monkeypatch, 2)
+    assert storage.migrate_single_file() == len(USER_IDS)
+
+    # the main file stays the directory
+    assert _users(main_engine) == set(USER_IDS)
+    assert _weights(main_engine) == {}
+    for shard, shard_engine in enumerate(backend.engines()):
+        expected = {user_id for user_id in USER_IDS if storage.shard_for(user_id, 2) == shard}
+        assert _users(shard_engine) == expected
+        assert _weights(shard_engine) == {user_id: 3 for user_id in expected}
+
+def test_migrate_single_file_can_keep_the_source(main_engine, monkeypatch):
+    _use_shards(monkeypatch, 2)
+    storage.migrate_single_file(prune=False)
+    assert _weights(main_engine) == {user_id: 3 for user_id in USER_IDS}
+
+def test_rebalance_moves_users_whose_shard_changed(main_engine, monkeypatch):
+    _use_shards(monkeypatch, 2)
+    storage.migrate_single_file()
+
+    for old_count, count in ((2, 3), (3, 2)):
+        backend = _use_shards(monkeypatch, count)
+        moved = {user_id for user_id in USER_IDS if storage.shard_for(user_id, old_count) != storage.shard_for(user_id, count)}
+        assert storage.rebalance(old_count) == len(moved)
+        for shard, shard_engine in enumerate(backend.engines()):
+            expected = {user_id for user_id in USER_IDS if storage.shard_for(user_id, count) == shard}
+            assert _users(shard_engine) == expected
+            assert _weights(shard_engine) == {user_id: 3 for user_id in expected}
+
+    # shrinking back leaves the dropped shard empty
+    dropped = create_engine(storage.SHARD_URL.format(shard=2))
+    assert _users(dropped) == set() and _weights(dropped) == {}
+    dropped.dispose()
@@ -0,0 +1,31 @@
+import asyncio
+import pytest
+from app import streaming
+
+def _collect(rows):
+    async def run():
+        return [row async for row in rows]
+    return asyncio.run(run())
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+def test_lines_split_across_chunks():
+    lines = _collect(streaming.iter_lines(_chunks(b'{"a": 1}\n{"b"', b': 2}\n', b'{"c": 3}')))
+    assert lines == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
+
+def test_ndjson_skips_blank_lines_and_keeps_bad_ones_for_rejection():
+    rows = _collect(streaming.iter_rows(_chunks(b'{"a": 1}\n\n{oops\n'), "weight", "ndjson"))
+    assert rows == [{"a": 1}, None]
+
+def test_csv_is_positional_after_the_header():
+    body = "\ufefffecha,peso\n2026-01-01T08:00:00,70.5\n2026-01-02T08:00:00\n".encode()
+    rows = _collect(streaming.iter_rows(_chunks(body), "weight", "csv"))
+    assert rows == [{"date": "2026-01-01T08:00:00", "weight": "70.5"}, None]
+
+def test_unknown_type_or_format():
+    with pytest.raises(ValueError):
+        streaming.iter_rows(_chunks(), "sleep", "ndjson")
+    with pytest.raises(ValueError):
+        streaming.iter_rows(_chunks(), "weight", "xml")
@@ -0,0 +1,45 @@
+from app import tokens
+from .conftest import PASSWORD, register
+
+def test_expired_token_is_rejected(client, user, monkeypatch):
+    monkeypatch.setattr(tokens, "TOKEN_TTL_SECONDS", -1)
+    expired = tokens.issue(user[0])
+    assert tokens.decode(expired) is None
+    response = client.get(f"/dashboard/{user[0]}/current", headers={"Authorization": f"Bearer {expired}"})
+    assert response.status_code == 401
+
+def test_tampered_token_is_rejected(user):
+    token = user[1]["Authorization"].split()[1]
+    header, payload, signature = token.split(".")
+    assert tokens.decode(token)["sub"] == str(user[0])
+    assert tokens.decode(f"{header}.{payload}x.{signature}") is None
+    assert tokens.decode("not-a-token") is None
+
+def test_logout_revokes_the_token(client, user):
+    url = f"/dashboard/{user[0]}/current"
+    assert client.get(url, headers=user[1]).status_code == 200
+    assert client.post("/logout", headers=user[1]).status_code == 200
+    assert client.get(url, headers=user[1]).status_code == 401
+
+def test_revocation_list_forgets_expired_entries(monkeypatch):
+    revoked = tokens.RevocationList(purge_interval=0)
+    revoked.revoke("old", 0)
+    revoked.revoke("new", 2 ** 40)
+    assert not revoked.is_revoked("old")
+    assert revoked.is_revoked("new")
+
+def test_token_only_works_for_its_user(client, user):
+    other_id, _, _ = register(client)
+    for method, url in (("get", f"/dashboard/{other_id}/current"), ("get", f"/users/{other_id}"), ("get", f"/users/{other_id}/export")):
+        assert client.request(method, url, headers=user[1]).status_code == 403
+
+def test_profile_needs_the_owner(client):
+    user_id, headers, body = register(client)
+    update = {key: body[key] for key in ("email", "username", "birthday", "gender")}
+    assert client.get(f"/users/{user_id}").status_code == 401
+    assert client.put(f"/users/{user_id}", json=update).status_code == 401
+    assert client.get(f"/users/{user_id}", headers=headers).json()["username"] == body["username"]
+    response = client.put(f"/users/{user_id}", json={**update, "gender": "Masculino"}, headers=headers)
+    assert response.status_code == 200, response.text
+    login = client.post("/login", json={"username": body["username"], "password": PASSWORD})
+    assert login.status_code == 200
@@ -0,0 +1,30 @@
+from app import crud, passwords
+from app.database import SessionLocal
+from .conftest import PASSWORD, register
+
+def _stored_password(username):
+    with SessionLocal() as db:
+        return crud.get_user_by_username(db, username).password
+
+def test_new_user_has_derived_series(client):
+    user_id, headers, body = register(client)
+    response = client.get(f"/dashboard/{user_id}/derived", params={"metric": "bmi", "period": "1w"}, headers=headers)
+    assert response.status_code == 200, response.text
+    expected = round(body["current_weight"] / (body["current_height"] / 100) ** 2, 1)
+    assert [round(point["value"], 1) for point in response.json()["data"]] == [expected]
+
+def test_login_rehashes_a_plaintext_password(client):
+    _, _, body = register(client)
+    with SessionLocal() as db:
+        crud.update_password(db, crud.get_user_by_username(db, body["username"]), PASSWORD)
+
+    credentials = {"username": body["username"], "password": PASSWORD}
+    assert client.post("/login", json=credentials).status_code == 200
+    stored = _stored_password(body["username"])
+    assert stored != PASSWORD
+    assert stored.split("$")[:4] == [passwords.PREFIX, str(passwords.hasher.n), str(passwords.hasher.r), str(passwords.hasher.p)]
+
+    # the new hash is what the next login checks
+    assert client.post("/login", json=credentials).status_code == 200
+    assert _stored_password(body["username"]) == stored
+    assert client.post("/login", json={**credentials, "password": "otra-clave"}).status_code == 401
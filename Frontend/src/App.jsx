@@ -11,7 +11,8 @@ import Profile from './pages/Dashboard/Profile';
 
 const ProtectedRoute = ({ children }) => {
   const userId = localStorage.getItem('userId');
-  if (!userId) {
+  const token = localStorage.getItem('accessToken');
+  if (!userId || !token) {
     return <Navigate to="/login" replace />;
   }
   return children;
@@ -19,7 +20,8 @@ const ProtectedRoute = ({ children }) => {
 
 const InitialRedirect = () => {
   const userId = localStorage.getItem('userId');
-  return <Navigate to={userId ? "/dashboard" : "/login"} replace />;
+  const token = localStorage.getItem('accessToken');
+  return <Navigate to={userId && token ? "/dashboard" : "/login"} replace />;
 };
 
 function App() {
@@ -42,10 +42,11 @@ export const AuthProvider = ({ children }) => {
       const userId = data.user_id;
       
       // Si el login es exitoso:
-      // 1. Guarda el userId en localStorage (persistencia)
+      // 1. Guarda el userId y el token en localStorage (persistencia)
       // 2. Actualiza el estado del usuario
       // 3. Navega al dashboard
       localStorage.setItem('userId', userId);
+      localStorage.setItem('accessToken', data.access_token);
       setUser({ id: userId });
       navigate('/dashboard');
       
@@ -83,6 +84,7 @@ export const AuthProvider = ({ children }) => {
       // 2. Resetea el estado del usuario y sus detalles
       // 3. Regresa a login
       localStorage.removeItem('userId');
+      localStorage.removeItem('accessToken');
       setUser(null);
       setUserDetails(null);
       navigate('/login');
@@ -1,5 +1,22 @@
 const API_URL = 'http://localhost:8000';
 
+// token que devuelve /login, requerido por el dashboard y la importación
+const authHeaders = () => {
+  const token = localStorage.getItem('accessToken');
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
+// un 401 significa token vencido o inválido: se limpia la sesión y se vuelve al login
+const checkSession = (response) => {
+  if (response.status === 401) {
+    localStorage.removeItem('userId');
+    localStorage.removeItem('accessToken');
+    window.location.assign('/login');
+    throw new Error('Sesión expirada');
+  }
+  return response;
+};
+
 export const api = {
   auth: {
     login: async ({ username, password }) => {
@@ -33,9 +50,10 @@ export const api = {
     },
 
     logout: async () => {
-      const response = await fetch(`${API_URL}/logout`, {
-        method: 'POST'
-      });
+      const response = checkSession(await fetch(`${API_URL}/logout`, {
+        method: 'POST',
+        headers: authHeaders(),
+      }));
       
       if (!response.ok) {
         const error = await response.json();
@@ -49,42 +67,60 @@ export const api = {
   user: {
     // nuevo método para obtener detalles del usuario
     getDetails: async (userId) => {
-      const response = await fetch(`${API_URL}/users/${userId}`);
+      const response = checkSession(await fetch(`${API_URL}/users/${userId}`, {
+        headers: authHeaders(),
+      }));
       if (!response.ok) throw new Error('Error al obtener datos del usuario');
       return response.json();
     },
 
     getCurrentStats: async (userId) => {
-      const response = await fetch(`${API_URL}/dashboard/${userId}/current`);
+      const response = checkSession(await fetch(`${API_URL}/dashboard/${userId}/current`, {
+        headers: authHeaders(),
+      }));
       if (!response.ok) throw new Error('Error al obtener estadísticas actuales');
       return response.json();
     },
 
-    getHistory: async (userId, metric, period) => {
-      const response = await fetch(
-        `${API_URL}/dashboard/${userId}/history?metric=${metric}&period=${period}`
+    // stream de actualizaciones: un evento "snapshot" con las estadísticas actuales y
+    // luego eventos "delta" con solo los campos que cambiaron tras cada importación.
+    // EventSource no permite headers, así que el token va en la URL
+    subscribeCurrentStats: (userId, { onSnapshot, onDelta }) => {
+      const token = localStorage.getItem('accessToken');
+      const source = new EventSource(
+        `${API_URL}/dashboard/${userId}/live?access_token=${encodeURIComponent(token || '')}`
       );
+      source.addEventListener('snapshot', (event) => onSnapshot(JSON.parse(event.data)));
+      source.addEventListener('delta', (event) => onDelta(JSON.parse(event.data)));
+      return () => source.close();
+    },
+
+    getHistory: async (userId, metric, period) => {
+      const response = checkSession(await fetch(
+        `${API_URL}/dashboard/${userId}/history?metric=${metric}&period=${period}`,
+        { headers: authHeaders() }
+      ));
       if (!response.ok) throw new Error('Error al obtener historial');
       return response.json();
     },
 
     importData: async (userId, type, data) => {
-      const response = await fetch(`${API_URL}/users/${userId}/import`, {
+      const response = checkSession(await fetch(`${API_URL}/users/${userId}/import`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({ import_type: type, data }),
-      });
+      }));
       
       if (!response.ok) throw new Error('Error al importar datos');
       return response.json();
     },
 
     updateProfile: async (userId, data) => {
-      const response = await fetch(`${API_URL}/users/${userId}`, {
+      const response = checkSession(await fetch(`${API_URL}/users/${userId}`, {
         method: 'PUT',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify(data),
-      });
+      }));
       
       if (!response.ok) throw new Error('Error al actualizar perfil');
       return response.json();
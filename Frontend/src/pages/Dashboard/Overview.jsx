@@ -46,6 +46,18 @@ const Overview = () => {
     fetchStats();
   }, [user.id]);
 
+  // actualizaciones en vivo después de cada importación
+  useEffect(() => {
+    return api.user.subscribeCurrentStats(user.id, {
+      onSnapshot: (data) => setStats(data),
+      onDelta: (changes) => setStats((previous) => previous && {
+        ...previous,
+        ...changes,
+        body_composition: { ...previous.body_composition, ...changes.body_composition },
+      }),
+    });
+  }, [user.id]);
+
   if (loading) {
     return (
       <div className="min-h-screen bg-gradient-to-br from-purple-50 via-white to-blue-50 p-8 flex items-center justify-center">